@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from geocoder_constants import ADDRESS_NORMALIZATION_VERSION, STREET_ABBREVIATIONS
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+def normalize_address(address, level='full'):
+    """
+    Build the cache key of an address, identical for the variants of a same address
+
+    - basic: unicode normalization, case folding, punctuation and whitespace collapsing
+    - full: basic, plus abbreviation of street suffixes and directions
+
+    Keys are prefixed by the level and the normalization version, so they never collide with the raw addresses
+    used as keys without normalization, nor with the keys of another normalization
+    :param address:
+    :param level: 'basic' or 'full'
+    :return: normalized key
+    """
+    text = unicodedata.normalize('NFKC', str(address)).casefold()
+    tokens = PUNCTUATION.sub(' ', text).split()
+    if level == 'full':
+        tokens = [STREET_ABBREVIATIONS.get(token, token) for token in tokens]
+    return '{}-v{}|{}'.format(level, ADDRESS_NORMALIZATION_VERSION, ' '.join(tokens))
+
+
+def factorize_addresses(addresses, level='none'):
+    """
+    Group addresses by their normalized key, each distinct raw address being normalized only once
+
+    :param addresses: pandas series of addresses
+    :param level: 'none', 'basic' or 'full'
+    :return: codes of the key of each address (-1 for missing addresses), list of distinct keys, and list of the
+    first raw address of each key, to be sent to the geocoding provider
+    """
+    codes, raw_addresses = pd.factorize(addresses)
+    raw_addresses = np.asarray(raw_addresses, dtype=object)
+    if level == 'none':
+        return codes, list(raw_addresses), list(raw_addresses)
+
+    keys = np.array([normalize_address(address, level) for address in raw_addresses], dtype=object)
+    key_codes, unique_keys = pd.factorize(keys)
+    _, first_positions = np.unique(key_codes, return_index=True)
+
+    codes = np.where(codes >= 0, key_codes[codes] if len(key_codes) else codes, -1)
+    return codes, list(unique_keys), list(raw_addresses[first_positions])
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from geocoder_constants import BATCH_RETRY_BACKOFF, BATCH_RETRY_BUDGET, BATCH_RETRY_MAX_DELAY, THROTTLING_STATUS_CODES
+from misc import is_answered
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+
+class BatchRetry(object):
+    """
+    Batch geocoding function resubmitting the batches that fail, as a whole, to `batch_function`
+
+    A failed batch (exception, timeout, HTTP error) is split in two halves, each being submitted again after an
+    exponential backoff, so that the valid queries of the batch are still resolved while the query that makes it
+    fail is isolated. Single queries left are sent to `single_function`, the non-batch endpoint of the provider,
+    if any. A batch the provider throttles is not split but submitted again as a whole after the backoff. Each batch
+    can cost at most `budget` provider calls on top of the initial one, after which the queries still failing are
+    given up.
+    """
+
+    def __init__(self, batch_function, single_function=None, budget=BATCH_RETRY_BUDGET, backoff=BATCH_RETRY_BACKOFF,
+                 max_delay=BATCH_RETRY_MAX_DELAY):
+        self.batch_function = batch_function
+        self.single_function = single_function
+        self.budget = budget
+        self.backoff = backoff
+        self.max_delay = max_delay
+
+    def __call__(self, queries):
+        """
+        :param queries: list of queries
+        :return: list of the result of each query, None for the queries which failed
+        """
+        # Budget of this batch, batches being possibly submitted concurrently
+        remaining = [self.budget]
+        results = self._submit(list(queries), 0, remaining)
+        if remaining[0] < self.budget:
+            logger.info("Resubmitted parts of a failed batch of {} queries in {} calls, {} queries still failing".format(
+                len(queries), self.budget - remaining[0], len([res for res in results if res is None])))
+        return results
+
+    def _call(self, function, query):
+        """
+        :return: tuple of the output of `function`, None if the provider did not answer, and whether it throttled
+        the query
+        """
+        try:
+            out = function(query)
+        except Exception as e:
+            logger.debug("Failed to geocode %s (%s)" % (query, e))
+            return None, False
+        if is_answered(out):
+            return out, False
+        return None, getattr(out, 'status_code', None) in THROTTLING_STATUS_CODES
+
+    def _submit(self, queries, attempt, remaining):
+        if attempt > 0 and len(queries) == 1 and self.single_function is not None:
+            return [self._call(self.single_function, queries[0])[0]]
+
+        out, throttled = self._call(self.batch_function, queries)
+        if out is not None:
+            return list(out)
+        if remaining[0] <= 0 or (len(queries) == 1 and self.single_function is None and attempt > 0 and not throttled):
+            return [None] * len(queries)
+
+        delay = min(self.max_delay, self.backoff * 2 ** attempt)
+        if throttled:
+            # The queries of the batch are not at fault
+            logger.warning("Batch of {} queries throttled, resubmitting it in {:.1f}s".format(len(queries), delay))
+            time.sleep(delay)
+            remaining[0] -= 1
+            return self._submit(queries, attempt + 1, remaining)
+
+        logger.warning("Batch of {} queries failed, resubmitting it in halves in {:.1f}s".format(len(queries), delay))
+        time.sleep(delay)
+        if len(queries) == 1:
+            remaining[0] -= 1
+            return self._submit(queries, attempt + 1, remaining)
+
+        middle = len(queries) // 2
+        results = []
+        for half in (queries[:middle], queries[middle:]):
+            if remaining[0] <= 0:
+                results += [None] * len(half)
+            else:
+                remaining[0] -= 1
+                results += self._submit(half, attempt + 1, remaining)
+        return results
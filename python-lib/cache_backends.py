@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import math
+import time
+
+from contextlib import contextmanager
+
+from cache_handler import MISSING, NO_MATCH_TAG, CacheHandler, MemoryCache
+from cache_transfer import decode_key, encode_key
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+CACHE_BACKENDS = ['disk', 'redis']
+
+
+def get_cache_handler(config, forward=True):
+    """
+    Open the geocoding cache of the configured backend
+    :param config: processed recipe configuration
+    :param forward: forward or reverse geocoding cache, kept apart in a shared backend
+    :return: CacheHandler, or RedisCacheHandler
+    """
+    backend = config.get('cache_backend', 'disk')
+    if backend == 'redis':
+        namespace = 'geocoder:{}:'.format('forward' if forward else 'reverse')
+        return RedisCacheHandler(config.get('redis_url'), namespace=namespace, enabled=config['cache_enabled'],
+                                 memory_size=config['cache_memory_size'])
+    if backend != 'disk':
+        raise AttributeError('Unknown cache backend {}, please select one of {}.'.format(backend, CACHE_BACKENDS))
+    return CacheHandler(config['cache_location'], enabled=config['cache_enabled'], size_limit=config['cache_size'],
+                        eviction_policy=config['cache_eviction'], memory_size=config['cache_memory_size'])
+
+
+def connect_redis(url):
+    try:
+        import redis
+    except ImportError:
+        raise ImportError('The Redis cache backend requires the redis package (4.0 or later) in the code environment.')
+    if not url:
+        raise AttributeError('Please enter the URL of the Redis server.')
+    return redis.Redis.from_url(url)
+
+
+class RedisCacheHandler(object):
+    """
+    Geocoding cache stored on a server speaking the Redis protocol, shared between hosts, optionally fronted by an
+    in-memory tier of `memory_size` entries
+
+    It exposes the interface of CacheHandler used by the geocoding of dataframes. Bulk reads are a single MGET and
+    bulk writes a single pipeline, whatever the number of keys. Keys and values are stored as JSON under `namespace`,
+    so that they read the same from any Python or numpy version. Eviction is left to the maxmemory policy of the
+    server.
+    """
+
+    def __init__(self, client, namespace='geocoder:', enabled=True, memory_size=0):
+        """
+        :param client: Redis client, or URL of the server
+        :param namespace: prefix of the keys
+        :param enabled: whether results are cached at all
+        :param memory_size: number of entries of the in-memory tier, 0 to disable
+        """
+        self._enabled = enabled
+        self._memory = MemoryCache(memory_size or 0)
+        self._pipeline = None
+        self.namespace = namespace
+        self.hit_counts = {'memory': 0, 'remote': 0, 'miss': 0}
+        self.client = (connect_redis(client) if isinstance(client, str) or client is None else client) if enabled else None
+
+    def _redis_key(self, key):
+        if isinstance(key, tuple) and len(key) == 2 and key[0] == NO_MATCH_TAG:
+            return '{}n:{}'.format(self.namespace, encode_key(key[1]))
+        return '{}r:{}'.format(self.namespace, encode_key(key))
+
+    def _cache_key(self, redis_key):
+        if isinstance(redis_key, bytes):
+            redis_key = redis_key.decode('utf-8')
+        kind, encoded = redis_key[len(self.namespace):].split(':', 1)
+        return (NO_MATCH_TAG, decode_key(encoded)) if kind == 'n' else decode_key(encoded)
+
+    def get(self, key, default=None, expire_time=False, **kwargs):
+        value = default
+        expire = None
+        if self._enabled:
+            redis_key = self._redis_key(key)
+            encoded = self.client.get(redis_key)
+            if encoded is not None:
+                value = json.loads(encoded)
+                ttl = self.client.pttl(redis_key)
+                expire = time.time() + ttl / 1000. if ttl > 0 else None
+        return (value, expire) if expire_time else value
+
+    def set(self, key, value, expire=None, **kwargs):
+        if self._enabled:
+            if not (isinstance(key, tuple) and key and key[0] == NO_MATCH_TAG):
+                self._memory.set(key, value)
+            client = self._pipeline if self._pipeline is not None else self.client
+            client.set(self._redis_key(key), json.dumps(value), ex=int(math.ceil(expire)) if expire else None)
+        return True
+    __setitem__ = set
+
+    def __getitem__(self, key):
+        value = self.get_many([key]).get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        if self._enabled:
+            return self._memory.get(key) is not MISSING or bool(self.client.exists(self._redis_key(key)))
+        return False
+
+    def __len__(self):
+        return len(list(self.iterkeys()))
+
+    def iterkeys(self, *args, **kwargs):
+        if self._enabled:
+            return (self._cache_key(key) for key in self.client.scan_iter(match=self.namespace + '*', count=1000))
+        return iter([])
+
+    @contextmanager
+    def transact(self, retry=True):
+        """
+        Queue the writes of the block, and send them at its end in a single MULTI/EXEC transaction
+        """
+        if not self._enabled or self._pipeline is not None:
+            yield
+            return
+        self._pipeline = self.client.pipeline(transaction=True)
+        try:
+            yield
+            self._pipeline.execute()
+        finally:
+            self._pipeline = None
+
+    def get_many(self, keys):
+        """
+        Retrieve the values of several keys, the ones missing from memory in a single MGET
+        :param keys: iterable of keys
+        :return: dict of the values of the keys found in the cache
+        """
+        results = {}
+        if self._enabled:
+            remote = []
+            for key in keys:
+                value = self._memory.get(key)
+                if value is MISSING:
+                    remote.append(key)
+                else:
+                    results[key] = value
+            self.hit_counts['memory'] += len(results)
+
+            if remote:
+                values = self.client.mget([self._redis_key(key) for key in remote])
+                for key, encoded in zip(remote, values):
+                    if encoded is None:
+                        self.hit_counts['miss'] += 1
+                    else:
+                        self.hit_counts['remote'] += 1
+                        results[key] = json.loads(encoded)
+                        self._memory.set(key, results[key])
+        return results
+
+    def set_many(self, items):
+        """
+        Store several values, in memory and in a single pipeline
+        :param items: dict or iterable of (key, value) pairs
+        """
+        if self._enabled:
+            items = items.items() if isinstance(items, dict) else items
+            with self.transact():
+                for key, value in items:
+                    self.set(key, value)
+
+    def get_no_matches(self, keys):
+        """
+        Retrieve which keys are remembered as having no match, in a single MGET
+        :param keys: iterable of keys
+        :return: set of the keys without match
+        """
+        keys = list(keys)
+        if not self._enabled or not keys:
+            return set()
+        values = self.client.mget([self._redis_key((NO_MATCH_TAG, key)) for key in keys])
+        return set([key for key, value in zip(keys, values) if value is not None])
+
+    def set_no_matches(self, keys, ttl):
+        """
+        Remember that several keys have no match, for `ttl` seconds, in a single pipeline
+        :param keys: iterable of keys
+        :param ttl: time to live in seconds
+        """
+        if self._enabled:
+            with self.transact():
+                for key in keys:
+                    self.set((NO_MATCH_TAG, key), True, expire=ttl)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        if self._enabled:
+            self.close()
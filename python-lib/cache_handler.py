@@ -1,36 +1,262 @@
 # -*- coding: utf-8 -*-
 
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
 from diskcache import Cache
+from diskcache.core import DBNAME
+
+from cache_values import decode_value, encode_value
+
+MISSING = object()
+# Namespace of the keys remembered as having no match, kept apart from the keys of the geocoding results
+NO_MATCH_TAG = 'no-match'
+# Namespace of the keys of the encoded values, which the releases reading pickled values miss instead of misreading
+ENCODED_TAG = 'encoded'
+
+
+def is_no_match_key(key):
+    return isinstance(key, tuple) and len(key) == 2 and key[0] == NO_MATCH_TAG
+
+
+def is_encoded_key(key):
+    return isinstance(key, tuple) and len(key) == 2 and key[0] == ENCODED_TAG
+
+
+def get_disk_key(key):
+    """
+    Key under which the encoded value of `key` is stored on disk
+    """
+    return key if is_no_match_key(key) else (ENCODED_TAG, key)
+
+
+class MemoryCache(object):
+    """
+    Thread safe, bounded, least recently used in-memory cache
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+                return self._items[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
 
 
 class CacheHandler(Cache):
+    """
+    Disk cache, optionally fronted by an in-memory tier of `memory_size` entries
+
+    Reads go to the memory tier first then to the disk, disk hits being kept in memory. Writes go to both tiers.
+    The number of hits of each tier and of misses is counted in `hit_counts`.
+
+    Keys for which the provider found no match can also be remembered on disk for a limited time, separately from
+    the geocoding results.
+
+    Values are stored on disk in the compact binary encoding of `cache_values`, under keys of the ENCODED_TAG
+    namespace, and kept decoded in memory. Values stored by previous releases under their plain key are still read,
+    and moved to the namespace by `migrate_values`.
+    """
 
     def __init__(self, *args, **kwargs):
         self._enabled = kwargs.get('enabled', True)
+        self._memory = MemoryCache(kwargs.pop('memory_size', 0) or 0)
+        self.hit_counts = {'memory': 0, 'disk': 0, 'miss': 0}
 
         if self._enabled:
             super(CacheHandler, self).__init__(*args, **kwargs)
 
-    def set(self, *args, **kwargs):
+    def set(self, key, value, *args, **kwargs):
         if self._enabled:
-            return super(CacheHandler, self).set(*args, **kwargs)
+            self._memory.set(key, value)
+            return super(CacheHandler, self).set(get_disk_key(key), encode_value(value), *args, **kwargs)
         return True
     __setitem__ = set
 
+    def _read(self, key, *args, **kwargs):
+        """
+        Read the value of `key` from disk, under its encoded key then under its key of previous releases
+        """
+        disk_key = get_disk_key(key)
+        out = super(CacheHandler, self).get(disk_key, MISSING, *args, **kwargs)
+        if (out[0] if isinstance(out, tuple) else out) is MISSING and disk_key != key:
+            out = super(CacheHandler, self).get(key, MISSING, *args, **kwargs)
+        return out
+
+    def get(self, key, default=None, *args, **kwargs):
+        if not self._enabled:
+            # With its expire time or tag when asked for, as by diskcache
+            extra = tuple([None for option in ['expire_time', 'tag'] if kwargs.get(option)])
+            return (default,) + extra if extra else default
+        out = self._read(key, *args, **kwargs)
+        if isinstance(out, tuple):
+            # Value with its expire time or tag
+            return (default if out[0] is MISSING else decode_value(out[0]),) + out[1:]
+        return default if out is MISSING else decode_value(out)
+
     def __exit__(self, *args, **kwargs):
         if self._enabled:
             super(CacheHandler, self).__exit__(*args, **kwargs)
 
     def __contains__(self, key):
         if self._enabled:
-            return super(CacheHandler, self).__contains__(key)
+            if self._memory.get(key) is not MISSING or super(CacheHandler, self).__contains__(get_disk_key(key)):
+                return True
+            return not is_no_match_key(key) and super(CacheHandler, self).__contains__(key)
         return False
 
     def __getitem__(self, key):
         if self._enabled:
-            return super(CacheHandler, self).__getitem__(key)
+            value = self._memory.get(key)
+            if value is not MISSING:
+                self.hit_counts['memory'] += 1
+                return value
+            value = self._read(key)
+            if value is MISSING:
+                self.hit_counts['miss'] += 1
+                raise KeyError(key)
+            value = decode_value(value)
+            self.hit_counts['disk'] += 1
+            self._memory.set(key, value)
+            return value
         raise KeyError(key)
 
+    def iterkeys(self, *args, **kwargs):
+        if self._enabled:
+            return self._iterkeys(*args, **kwargs)
+        return iter([])
+
+    def _iterkeys(self, *args, **kwargs):
+        for key in super(CacheHandler, self).iterkeys(*args, **kwargs):
+            if is_encoded_key(key):
+                yield key[1]
+            elif is_no_match_key(key) or not super(CacheHandler, self).__contains__(get_disk_key(key)):
+                # Keys of previous releases, unless also stored encoded
+                yield key
+
+    def get_many(self, keys):
+        """
+        Retrieve the values of several keys, the ones missing from memory in a single disk transaction
+        :param keys: iterable of keys
+        :return: dict of the values of the keys found in the cache
+        """
+        results = {}
+        if self._enabled:
+            on_disk = []
+            for key in keys:
+                value = self._memory.get(key)
+                if value is MISSING:
+                    on_disk.append(key)
+                else:
+                    results[key] = value
+            self.hit_counts['memory'] += len(results)
+
+            if on_disk:
+                with self.transact(retry=True):
+                    for key in on_disk:
+                        value = self._read(key, retry=True)
+                        if value is MISSING:
+                            self.hit_counts['miss'] += 1
+                        else:
+                            self.hit_counts['disk'] += 1
+                            value = decode_value(value)
+                            results[key] = value
+                            self._memory.set(key, value)
+        return results
+
+    def set_many(self, items):
+        """
+        Store several values, in memory and in a single disk transaction
+        :param items: dict or iterable of (key, value) pairs
+        """
+        if self._enabled:
+            items = items.items() if isinstance(items, dict) else items
+            with self.transact(retry=True):
+                for key, value in items:
+                    self._memory.set(key, value)
+                    super(CacheHandler, self).set(get_disk_key(key), encode_value(value), retry=True)
+
+    def get_no_matches(self, keys):
+        """
+        Retrieve which keys are remembered as having no match, in a single disk transaction
+        :param keys: iterable of keys
+        :return: set of the keys without match
+        """
+        no_matches = set()
+        if self._enabled:
+            with self.transact(retry=True):
+                for key in keys:
+                    if super(CacheHandler, self).get((NO_MATCH_TAG, key), default=MISSING, retry=True) is not MISSING:
+                        no_matches.add(key)
+        return no_matches
+
+    def set_no_matches(self, keys, ttl):
+        """
+        Remember that several keys have no match, for `ttl` seconds, in a single disk transaction
+        :param keys: iterable of keys
+        :param ttl: time to live in seconds
+        """
+        if self._enabled:
+            with self.transact(retry=True):
+                for key in keys:
+                    super(CacheHandler, self).set((NO_MATCH_TAG, key), True, expire=ttl, tag=NO_MATCH_TAG, retry=True)
+
+    def migrate_values(self, batch_size=10000):
+        """
+        Move the values stored by previous releases to the ENCODED_TAG namespace in the compact binary encoding,
+        keeping their expire time and tag, then compact the database file
+
+        Previous releases sharing the cache miss the migrated values, which is to be run once all of them are upgraded.
+        :param batch_size: number of entries migrated in each disk transaction
+        :return: number of values migrated
+        """
+        if not self._enabled:
+            return 0
+        migrated = 0
+        keys = [key for key in super(CacheHandler, self).iterkeys()
+                if not is_encoded_key(key) and not is_no_match_key(key)]
+        for start in range(0, len(keys), batch_size):
+            with self.transact(retry=True):
+                for key in keys[start:start + batch_size]:
+                    value, expire_time, tag = super(CacheHandler, self).get(key, default=MISSING, expire_time=True,
+                                                                            tag=True, retry=True)
+                    if value is MISSING:
+                        continue
+                    expire = expire_time - time.time() if expire_time else None
+                    super(CacheHandler, self).set(get_disk_key(key), encode_value(value), expire=expire, tag=tag,
+                                                  retry=True)
+                    super(CacheHandler, self).delete(key, retry=True)
+                    migrated += 1
+        if migrated:
+            # Pages freed by the smaller values are only given back to the file system by a VACUUM
+            connection = sqlite3.connect(os.path.join(self.directory, DBNAME), isolation_level=None)
+            try:
+                connection.execute('VACUUM')
+            finally:
+                connection.close()
+        return migrated
+
     def __enter__(self, *args, **kwargs):
         if self._enabled:
             super(CacheHandler, self).__enter__(*args, **kwargs)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import math
+import time
+
+import pandas as pd
+
+from cache_handler import NO_MATCH_TAG
+from spatial_cache import is_location
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+CACHE_COLUMNS = ['key', 'value', 'no_match', 'expire_time']
+
+
+def encode_key(key):
+    return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+
+def decode_key(encoded):
+    key = json.loads(encoded)
+    # Locations are keyed by Python values, as in the reverse geocoding of dataframes
+    return tuple(key) if isinstance(key, list) else key
+
+
+def is_direction_key(key, forward=True):
+    """
+    Tell whether a cache key belongs to forward geocoding (an address) or to reverse geocoding (a location), both
+    caches sharing the same directory when a custom cache location is set
+    """
+    return not is_location(key) if forward else is_location(key)
+
+
+def export_cache(cache, forward=True, chunksize=10000):
+    """
+    Read the geocoding results and the queries without match of `cache`, by chunks
+
+    Keys and values are encoded as JSON, and queries without match keep the time at which they expire.
+    :param cache: CacheHandler
+    :param forward: export the forward geocoding entries, or the reverse geocoding ones
+    :param chunksize: number of entries of each chunk
+    :return: generator of dataframes of CACHE_COLUMNS columns
+    """
+    rows = []
+    for key in cache.iterkeys():
+        no_match = isinstance(key, tuple) and len(key) == 2 and key[0] == NO_MATCH_TAG
+        query = key[1] if no_match else key
+        if not is_direction_key(query, forward):
+            continue
+        value, expire_time = cache.get(key, default=None, expire_time=True)
+        if value is None:
+            # Expired since the keys were listed
+            continue
+        rows.append((encode_key(query), None if no_match else json.dumps(value), no_match, expire_time))
+        if len(rows) >= chunksize:
+            yield pd.DataFrame(rows, columns=CACHE_COLUMNS)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows, columns=CACHE_COLUMNS)
+
+
+def import_cache(cache, dataframes):
+    """
+    Store the entries of exported chunks into `cache`, in a single transaction
+
+    Queries without match already expired are left out, the other ones expire at the same time as in the exported
+    cache.
+    :param cache: CacheHandler
+    :param dataframes: iterable of dataframes of CACHE_COLUMNS columns
+    :return: number of entries stored
+    """
+    count = 0
+    now = time.time()
+    with cache.transact(retry=True):
+        for df in dataframes:
+            for encoded_key, value, no_match, expire_time in df[CACHE_COLUMNS].itertuples(index=False):
+                key = decode_key(encoded_key)
+                expire = None
+                if expire_time is not None and not math.isnan(expire_time):
+                    expire = expire_time - now
+                    if expire <= 0:
+                        continue
+                if no_match:
+                    cache.set((NO_MATCH_TAG, key), True, expire=expire, tag=NO_MATCH_TAG, retry=True)
+                else:
+                    cache.set(key, json.loads(value), expire=expire, retry=True)
+                count += 1
+    logger.info("Imported {} cache entries".format(count))
+    return count
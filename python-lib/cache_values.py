@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import numbers
+import struct
+import sys
+
+# First byte of an encoded value, identifying its format, to be bumped when a format changes
+LATLNG_FORMAT = 1
+FEATURES_FORMAT = 2
+
+FEATURES = ['address', 'city', 'postal', 'state', 'country']
+
+_LATLNG = struct.Struct('<Bdd')
+_LENGTH = struct.Struct('<H')
+# Length of a missing feature, longer features are not encoded
+_NONE_LENGTH = 0xFFFF
+
+
+def encode_value(value):
+    """
+    Compact binary encoding of a cache value
+
+    A forward geocoding [lat, lng] takes 17 bytes as two packed float64. The features of a reverse geocoding take
+    2 bytes per feature plus their UTF-8 text. Values of any other shape are returned unchanged, to be pickled.
+    :param value: [lat, lng] list, or dict of the FEATURES of a location
+    :return: bytes, or `value` itself when it cannot be encoded
+    """
+    if isinstance(value, (list, tuple)) and len(value) == 2 and all([isinstance(v, numbers.Real) for v in value]):
+        return _LATLNG.pack(LATLNG_FORMAT, value[0], value[1])
+
+    if isinstance(value, dict) and len(value) == len(FEATURES) and all([f in value for f in FEATURES]):
+        parts = [struct.pack('<B', FEATURES_FORMAT)]
+        for feature in FEATURES:
+            text = value[feature]
+            if text is None:
+                parts.append(_LENGTH.pack(_NONE_LENGTH))
+                continue
+            if not isinstance(text, str):
+                return value
+            encoded = text.encode('utf-8')
+            if len(encoded) >= _NONE_LENGTH:
+                return value
+            parts += [_LENGTH.pack(len(encoded)), encoded]
+        return b''.join(parts)
+
+    return value
+
+
+def decode_value(value):
+    """
+    Decode a value encoded by `encode_value`, values stored before the compact encoding being returned unchanged
+
+    Decoded features are interned, the same city, state or country names being shared by many locations.
+    """
+    if not isinstance(value, bytes) or not value:
+        return value
+
+    value_format = value[0]
+    if value_format == LATLNG_FORMAT and len(value) == _LATLNG.size:
+        _, lat, lng = _LATLNG.unpack(value)
+        return [lat, lng]
+
+    if value_format == FEATURES_FORMAT:
+        features = {}
+        offset = 1
+        for feature in FEATURES:
+            length, = _LENGTH.unpack_from(value, offset)
+            offset += _LENGTH.size
+            if length == _NONE_LENGTH:
+                features[feature] = None
+            else:
+                features[feature] = sys.intern(value[offset:offset + length].decode('utf-8'))
+                offset += length
+        return features
+
+    raise ValueError('Unknown cache value format {}, the cache was written by a later version of the plugin'.format(value_format))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import multiprocessing
+
+from cache_backends import get_cache_handler
+from dataframe_forward_geocoding import add_forward_geocode_columns, get_forward_geocode_function
+from dataframe_reverse_geocoding import add_reverse_geocode_columns, get_reverse_geocode_function
+from recipe_metrics import RecipeMetrics, TimedCache
+from spatial_cache import SpatialCache
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+# Chunk geocoder of the current worker process
+_worker_geocoder = None
+
+
+class ChunkGeocoder(object):
+    """
+    Geocoding of input chunks with a geocoding function, a cache connection and metrics of its own
+
+    One is created in each worker process of the multi-process mode, the cache backends being safe to share between
+    processes.
+    """
+
+    def __init__(self, forward, config, reference_df=None, geocode_function=None):
+        """
+        :param forward: forward or reverse geocoding
+        :param config: processed recipe configuration
+        :param reference_df: reference addresses of the offline forward geocoding provider
+        :param geocode_function: geocoding function to use instead of the one of the configured provider
+        """
+        self.forward = forward
+        self.config = config
+        self.metrics = RecipeMetrics()
+        # Each call to the provider is timed, each query of a virtual batch or of a resubmitted batch included
+        if geocode_function is None:
+            if forward:
+                geocode_function = get_forward_geocode_function(config, reference_df, self.metrics.wrap)
+            else:
+                geocode_function = get_reverse_geocode_function(config, self.metrics.wrap)
+        else:
+            geocode_function = self.metrics.wrap(geocode_function)
+        self.geocode_function = geocode_function
+
+        self.cache = get_cache_handler(config, forward)
+        cache = self.cache
+        if not forward and config['cache_enabled'] and config['cache_tolerance'] > 0:
+            cache = SpatialCache(cache, config['cache_tolerance'])
+        self.timed_cache = TimedCache(cache, self.metrics)
+
+    def __call__(self, df, stats=None):
+        """
+        :param df: input chunk
+        :param stats: metrics of the chunk measured outside of its geocoding, such as its read time
+        :return: tuple of the geocoded chunk, its metrics, the latencies of the provider calls and their errors
+        """
+        self.metrics.start_chunk(self.cache.hit_counts)
+        if len(df):
+            if self.forward:
+                df = add_forward_geocode_columns(self.timed_cache, self.config, df, self.geocode_function)
+            else:
+                df = add_reverse_geocode_columns(self.timed_cache, self.config, df, self.geocode_function)
+        self.metrics.end_chunk(len(df), count_not_geocoded(df, self.config, self.forward) if len(df) else 0,
+                               self.cache.hit_counts)
+        chunks, latencies, errors = self.metrics.drain()
+        chunk = chunks[0]
+        chunk.update(stats or {})
+        return df, chunk, latencies, errors
+
+    def close(self):
+        self.cache.__exit__(None, None, None)
+
+
+def count_not_geocoded(df, config, forward=True):
+    """
+    Number of rows of a geocoded chunk `df` left without result, rows without address or location included
+    """
+    if forward:
+        columns = [config['latitude'], config['longitude']]
+    else:
+        columns = [feature['column'] for feature in config['features']]
+    return int(df[columns].isnull().any(axis=1).sum())
+
+
+def _init_worker(forward, config, reference_df, geocode_function):
+    global _worker_geocoder
+    _worker_geocoder = ChunkGeocoder(forward, config, reference_df, geocode_function)
+
+
+def _geocode_chunk(df, stats):
+    return _worker_geocoder(df, stats)
+
+
+def geocode_chunks(chunks, forward, config, processes=1, reference_df=None, geocode_function=None):
+    """
+    Geocode an iterable of input chunks, sharded across `processes` worker processes
+
+    Chunks are yielded in the order of `chunks`, whatever the order in which the workers complete them, with at most
+    two chunks per worker in flight. Each worker paces its queries to its share of the rate limit of the provider.
+    :param chunks: iterable of tuples of an input chunk and its metrics measured outside of its geocoding
+    :param forward: forward or reverse geocoding
+    :param config: processed recipe configuration
+    :param processes: number of worker processes, 1 or less geocodes in the current process
+    :param reference_df: reference addresses of the offline forward geocoding provider
+    :param geocode_function: geocoding function to use instead of the one of the configured provider
+    :return: generator of tuples of a geocoded chunk, its metrics, the latencies of its provider calls and their errors
+    """
+    if processes <= 1:
+        geocoder = ChunkGeocoder(forward, config, reference_df, geocode_function)
+        try:
+            for df, stats in chunks:
+                yield geocoder(df, stats)
+        finally:
+            geocoder.close()
+        return
+
+    if config.get('rate_limit'):
+        config = dict(config, rate_limit=float(config['rate_limit']) / processes)
+    logger.info("Geocoding chunks in {} processes".format(processes))
+    # The pool is started before the chunks are read, so that no reader thread is running when the workers are forked
+    pool = multiprocessing.Pool(processes, _init_worker, (forward, config, reference_df, geocode_function))
+    try:
+        pending = collections.deque()
+        for df, stats in chunks:
+            pending.append(pool.apply_async(_geocode_chunk, (df, stats)))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
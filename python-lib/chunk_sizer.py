@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import pandas as pd
+
+from geocoder_constants import CHUNK_MEMORY_BUDGET_MB, CHUNK_MEMORY_COPIES, CHUNK_TARGET_SECONDS, INITIAL_CHUNK_SIZE, \
+    MAX_CHUNK_SIZE, MIN_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+
+class ChunkSizer(object):
+    """
+    Number of rows of the next chunk of the input dataset, adapted to the memory budget and to the throughput
+
+    The bytes per row of the first chunk bound the chunk size so that the chunks held in memory at once by the
+    pipeline fit in `memory_budget` bytes. Within that bound, chunks are resized after each one is geocoded to take
+    about `target_seconds`: runs mostly answered by the cache get larger chunks, runs waiting on a slow provider
+    smaller ones, which are written sooner.
+    """
+
+    def __init__(self, memory_budget=CHUNK_MEMORY_BUDGET_MB * 1e6, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE,
+                 initial_size=INITIAL_CHUNK_SIZE, chunks_in_memory=CHUNK_MEMORY_COPIES,
+                 target_seconds=CHUNK_TARGET_SECONDS):
+        """
+        :param memory_budget: bytes available to the chunks
+        :param min_size: minimum number of rows of a chunk
+        :param max_size: maximum number of rows of a chunk
+        :param initial_size: number of rows of the first chunk
+        :param chunks_in_memory: number of chunks held in memory at once
+        :param target_seconds: seconds in which a chunk should be geocoded
+        """
+        self.memory_budget = memory_budget
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.chunks_in_memory = chunks_in_memory
+        self.target_seconds = target_seconds
+        self.bytes_per_row = None
+        self.memory_size = self.max_size
+        self.size = self._bound(initial_size)
+
+    def _bound(self, size):
+        return int(max(self.min_size, min(self.max_size, self.memory_size, size)))
+
+    def measure_memory(self, df):
+        """
+        Bound the chunk size from the memory used by the rows of the chunk `df`
+        """
+        self.bytes_per_row = float(df.memory_usage(index=True, deep=True).sum()) / max(1, len(df))
+        self.memory_size = int(self.memory_budget / (self.bytes_per_row * self.chunks_in_memory))
+        self.size = self._bound(self.size)
+        logger.info("Input rows take {:.0f} bytes, chunks of at most {} rows".format(
+            self.bytes_per_row, self._bound(self.max_size)))
+
+    def update(self, rows, seconds):
+        """
+        Resize the next chunks after a chunk of `rows` rows was geocoded in `seconds`
+        """
+        if rows <= 0 or seconds <= 0:
+            return
+        size = self._bound(min(2 * self.size, rows / seconds * self.target_seconds))
+        if size != self.size:
+            logger.info("Resizing chunks from {} to {} rows".format(self.size, size))
+            self.size = size
+
+
+def rechunk(dataframes, sizer):
+    """
+    Regroup or split an iterable of dataframes into chunks of `sizer.size` rows, the size being read when each chunk
+    is cut, the last chunk being smaller
+    :param dataframes: iterable of dataframes with the same columns
+    :param sizer: ChunkSizer
+    :return: generator of dataframes
+    """
+    pending = []
+    pending_rows = 0
+    for df in dataframes:
+        if sizer.bytes_per_row is None and len(df):
+            sizer.measure_memory(df)
+        pending.append(df)
+        pending_rows += len(df)
+        while pending_rows >= sizer.size:
+            df = pending[0] if len(pending) == 1 else pd.concat(pending)
+            size = sizer.size
+            if len(df) == size:
+                pending = []
+                yield df
+            else:
+                pending = [df.iloc[size:].copy()]
+                yield df.iloc[:size].copy()
+            pending_rows = len(df) - size
+    if pending_rows:
+        yield pending[0] if len(pending) == 1 else pd.concat(pending)
@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
-from misc import is_empty
+from address_normalizer import factorize_addresses
+from batch_retry import BatchRetry
+from http_session import get_pooled_session
+from misc import NOT_FOUND, get_empty_mask, is_answered, is_no_match, set_column_values
+from offline_forward_geocoding import AddressIndex, OfflineMatch
+from parallel_utils import parallel_map
+from rate_limiter import RateLimiter
+from virtual_batch import VirtualBatch
 
 import geocoder
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
@@ -26,103 +34,220 @@ def add_forward_geocode_columns(cache, config, current_df, geocode_function):
         index = columns.index(config['address_column'])
         current_df = current_df.reindex(columns=columns[:index + 1] + columns_to_append + columns[index + 1:],
                                         copy=False)
-    # Normal, 1 by 1 geocoding when batch is not enabled/available
-    if not config['batch_enabled']:
-        current_df[config['latitude']], current_df[config['longitude']] = \
-            zip(*current_df.apply(perform_forward_geocode, axis=1, args=(config, geocode_function, cache)))
-
-    # Batch creation and geocoding otherwise
-    else:
-        batch = []
-        for i, row in current_df.iterrows():
-            if len(batch) == config['batch_size']:
-                perform_forward_geocode_batch(current_df, config, geocode_function, cache, batch)
-                batch = []
-
-            address = row[config['address_column']]
-            try:
-                if any([is_empty(row[config[c]]) for c in ['latitude', 'longitude']]):
-                    res = cache[address]
-                else:
-                    res = [row[config[c]] for c in ['latitude', 'longitude']]
-
-                current_df.loc[i, config['latitude']] = res[0]
-                current_df.loc[i, config['longitude']] = res[1]
-            except (KeyError, IndexError):
-                batch.append((i, address))
-
-        if len(batch) > 0:
-            perform_forward_geocode_batch(current_df, config, geocode_function, cache, batch)
+    # Geocoding of each distinct address, 1 by 1 or by batch when enabled/available
+    to_geocode, latlng = perform_forward_geocode_unique(current_df, config, geocode_function, cache)
+    set_column_values(current_df, config['latitude'], to_geocode, latlng[:, 0])
+    set_column_values(current_df, config['longitude'], to_geocode, latlng[:, 1])
     return current_df
 
 
-def get_forward_geocode_function(config):
+def get_forward_geocode_function(config, reference_df=None, wrap=None):
     """
     Handle authentication mechanism with respect to the chosen geocoding service provider `provider_function`
+
+    The offline provider looks addresses up in the index of the reference addresses `reference_df`. Each call to the
+    provider, single query or batch, goes through `wrap` if any, such as `RecipeMetrics.wrap`
     """
+    wrap = wrap or (lambda function: function)
+    if config['provider'] == 'offline':
+        return get_offline_geocode_function(config, reference_df, wrap)
+
     provider_function = getattr(geocoder, config['provider'])
+    # Keep-alive connections shared by all the queries, concurrent ones included
+    session = get_pooled_session(max(config.get('workers', 1), config.get('batch_concurrency', 1)))
 
     if config['provider'] == 'here':
-        return lambda address: provider_function(address, app_id=config['here_app_id'], app_code=config['here_app_code'])
+        geocode_function = lambda address: provider_function(address, app_id=config['here_app_id'], app_code=config['here_app_code'], session=session)
     elif config['provider'] == 'google':
-        return lambda address: provider_function(address, key=config['api_key'], client=config['google_client'], client_secret=config['google_client_secret'])
-    elif config['batch_enabled']:
-        return lambda addresses: provider_function(addresses, key=config['api_key'], method='batch', timeout=config['batch_timeout'])
+        geocode_function = lambda address: provider_function(address, key=config['api_key'], client=config['google_client'], client_secret=config['google_client_secret'], session=session)
+    elif config['batch_enabled'] and not config.get('virtual_batch'):
+        geocode_function = lambda addresses: provider_function(addresses, key=config['api_key'], method='batch', timeout=config['batch_timeout'], session=session)
+        # Failed batches are split and resubmitted, single addresses left going to the non-batch endpoint
+        single_function = lambda address: provider_function(address, key=config['api_key'], session=session)
+        rate_limiter = RateLimiter(config.get('rate_limit'))
+        return BatchRetry(wrap(rate_limiter.wrap(geocode_function)), wrap(rate_limiter.wrap(single_function)))
     else:
-        return lambda address: provider_function(address, key=config['api_key'])
+        geocode_function = lambda address: provider_function(address, key=config['api_key'], session=session)
+
+    geocode_function = wrap(RateLimiter(config.get('rate_limit')).wrap(geocode_function))
+    if config['batch_enabled']:
+        # Concurrent single queries behind the interface of the batch endpoints
+        return VirtualBatch(geocode_function, config.get('workers', 1))
+    return geocode_function
 
 
-def perform_forward_geocode(df, config, fun, cache):
+def get_offline_geocode_function(config, reference_df, wrap):
     """
-    Perform query of the forward geocoding
+    Batch geocoding function of the offline provider, the addresses missing from the reference table being
+    geocoded one by one with `config['fallback_provider']` if any, the lookups of each batch in the index and the
+    calls to the fallback provider going through `wrap`
+    """
+    index = AddressIndex.load_or_build(reference_df, config['reference_address_column'],
+                                       config['reference_lat_column'], config['reference_lng_column'])
+    index.min_similarity = config.get('min_similarity', index.min_similarity)
+
+    fallback_function = None
+    if config.get('fallback_provider'):
+        fallback_function = get_forward_geocode_function(dict(config, provider=config['fallback_provider'], batch_enabled=False),
+                                                         wrap=wrap)
+    index_function = wrap(index.geocode)
+
+    def geocode_function(addresses):
+        results = index_function(addresses)
+        missed = [position for position, res in enumerate(results) if res.lat is None]
+        if fallback_function is not None and missed:
+            latlngs = parallel_map(lambda position: geocode_address(addresses[position], fallback_function), missed,
+                                   config.get('workers', 1))
+            for position, latlng in zip(missed, latlngs):
+                if latlng is None:
+                    # Failed query, not to be remembered as a missing address
+                    results[position] = None
+                elif latlng is not NOT_FOUND:
+                    results[position] = OfflineMatch(latlng[0], latlng[1], None)
+            logger.info("Geocoded {} of {} addresses missing from the reference table with {}".format(
+                len([latlng for latlng in latlngs if latlng and latlng is not NOT_FOUND]), len(missed),
+                config['fallback_provider']))
+        return results
+
+    return geocode_function
+
+
+def perform_forward_geocode_unique(df, config, fun, cache):
+    """
+    Perform query of the forward geocoding for the rows of `df` that are not geocoded yet
 
-    First check cache for stored address, if not then apply geocoding function `fun`
-    to retrieve lat / long from address
+    Addresses are grouped by their key, normalized according to `config['address_normalization']`. Each key is
+    looked up once in the cache, then geocoded once with the geocoding function `fun` if missing (by batches of
+    `config['batch_size']` when batch is enabled), and the results are broadcast to all the rows sharing that key
 
     :param df:
     :param config:
     :param fun:
     :param cache:
-    :return:
+    :return: boolean mask of the rows to geocode, and the array of their [lat, lng]
     """
-    # Retrieve pandas serie of address to forward geocode
-    address = df[config['address_column']]
-    # Results
-    res = [None, None]
+    to_geocode = get_empty_mask(df, [config['latitude'], config['longitude']])
+    codes, keys, addresses = factorize_addresses(df[config['address_column']][to_geocode],
+                                                 config.get('address_normalization', 'none'))
 
-    try:
-        if any([is_empty(df[config[c]]) for c in ['latitude', 'longitude']]):
-            res = cache[address]
+    results = resolve_addresses(keys, addresses, config, fun, cache)
+
+    # Rows without address have a -1 code, which picks the trailing empty result
+    unique_latlng = np.array([res if res else [np.nan, np.nan] for res in results] + [[np.nan, np.nan]], dtype=float)
+    return to_geocode, unique_latlng[codes]
+
+
+def resolve_addresses(keys, addresses, config, fun, cache):
+    """
+    Retrieve the coordinates of distinct addresses, from the cache or with the geocoding function `fun`
+
+    Without batch, up to `config['workers']` queries are in flight, with batch up to `config['batch_concurrency']`
+    batches. Cache lookups and cache writes are done by the calling thread in the order of `keys`, each in a single
+    cache transaction. Results cached before normalization are found under the raw address, and are stored again
+    under the normalized key
+
+    Addresses for which the provider found no match are remembered for `config['no_match_ttl']` seconds and not
+    queried again meanwhile. Failed queries are not remembered
+
+    :param keys: list of distinct cache keys
+    :param addresses: list of the addresses to geocode for each key
+    :param config:
+    :param fun:
+    :param cache:
+    :return: list of [lat, lng], None for the addresses that could not be geocoded
+    """
+    cached = cache.get_many(keys)
+    missed = [position for position, key in enumerate(keys) if key not in cached]
+
+    if config.get('address_normalization', 'none') != 'none' and missed:
+        cached_raw = cache.get_many([addresses[position] for position in missed])
+        migrated = [(keys[position], cached_raw[addresses[position]]) for position in missed if addresses[position] in cached_raw]
+        cache.set_many(migrated)
+        cached.update(migrated)
+        missed = [position for position in missed if keys[position] not in cached]
+
+    no_match_ttl = config.get('no_match_ttl', 0)
+    no_matches = set()
+    if no_match_ttl > 0 and missed:
+        no_matches = cache.get_no_matches([keys[position] for position in missed])
+        missed = [position for position in missed if keys[position] not in no_matches]
+
+    results = [cached.get(key) for key in keys]
+
+    if config['batch_enabled']:
+        batches = [[addresses[position] for position in missed[start:start + config['batch_size']]]
+                   for start in range(0, len(missed), config['batch_size'])]
+        # Up to `config['batch_concurrency']` batches in flight, merged back in order whatever their completion order
+        outputs = []
+        for batch_outputs in parallel_map(lambda batch: perform_forward_geocode_batch(batch, fun), batches,
+                                          config.get('batch_concurrency', 1)):
+            outputs += batch_outputs
+    else:
+        outputs = parallel_map(lambda position: geocode_address(addresses[position], fun), missed, config.get('workers', 1))
+
+    new_no_matches = []
+    for position, latlng in zip(missed, outputs):
+        if latlng is NOT_FOUND:
+            new_no_matches.append(keys[position])
         else:
-            res = [df[config[c]] for c in ['latitude', 'longitude']]
+            results[position] = latlng
+    cache.set_many([(keys[position], results[position]) for position in missed if results[position]])
+    if no_match_ttl > 0:
+        cache.set_no_matches(new_no_matches, no_match_ttl)
 
-    except KeyError:
-        try:
-            out = fun(address)
-            if not out.latlng:
-                raise Exception('Failed to retrieve coordinates')
-            # Store result address in cache
-            cache[address] = res = out.latlng
-        except Exception as e:
-            logging.error("Failed to geocode %s (%s)" % (address, e))
+    failed = len([position for position in missed if not results[position]]) - len(new_no_matches)
+    logger.info("Geocoded {} distinct addresses, {} from cache, {} without match, {} failed".format(
+        len(keys), len(keys) - len(missed) - len(no_matches), len(no_matches) + len(new_no_matches), failed))
+    return results
 
-    return res
 
+def geocode_address(address, fun):
+    """
+    Query the geocoding function `fun` for a single address
 
-def perform_forward_geocode_batch(df, config, fun, cache, batch):
+    :param address:
+    :param fun:
+    :return: [lat, lng] of the address, NOT_FOUND if the provider found no match, None if the query failed
+    """
+    try:
+        out = fun(address)
+        if not out.latlng:
+            if is_no_match(out):
+                logger.debug("No match for %s" % address)
+                return NOT_FOUND
+            raise Exception('Failed to retrieve coordinates')
+        return out.latlng
+    except Exception as e:
+        logger.debug("Failed to geocode %s (%s)" % (address, e))
+        return None
+
+
+def perform_forward_geocode_batch(addresses, fun):
+    """
+    Query the batch geocoding function `fun` for a list of addresses
+
+    :param addresses:
+    :param fun:
+    :return: list of [lat, lng], NOT_FOUND for the addresses without match in a successful batch, None for the
+    addresses that could not be geocoded
+    """
     results = []
     try:
-        results = fun(list(zip(*batch))[1])
+        results = fun(addresses)
     except Exception as e:
-        logging.error("Failed to geocode the following batch: %s (%s)" % (batch, e))
+        logger.error("Failed to geocode a batch of %d addresses (%s)" % (len(addresses), e))
 
-    for res, orig in zip(results, batch):
+    latlngs = [None] * len(addresses)
+    for position, (res, address) in enumerate(zip(results, addresses)):
         try:
-            i, addr = orig
-            if isinstance(res.latlng, tuple) and any(res.latlng):
-                cache[addr] = res.latlng
-
-            df.loc[i, config['latitude']] = res.lat
-            df.loc[i, config['longitude']] = res.lng
+            if res.lat is None or res.lng is None:
+                if is_answered(results) and is_no_match(res):
+                    logger.debug("No match for %s" % address)
+                    latlngs[position] = NOT_FOUND
+                    continue
+                raise Exception('Failed to retrieve coordinates')
+            latlngs[position] = [res.lat, res.lng]
         except Exception as e:
-            logging.error("Failed to geocode %s (%s)" % (addr, e))
+            logger.debug("Failed to geocode %s (%s)" % (address, e))
+
+    return latlngs
@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
-from misc import is_empty
+from batch_retry import BatchRetry
+from http_session import get_pooled_session
+from misc import NOT_FOUND, get_empty_mask, is_answered, is_empty_column, is_no_match, set_column_values
+from offline_reverse_geocoding import GazetteerIndex
+from parallel_utils import parallel_map
+from rate_limiter import RateLimiter
+from virtual_batch import VirtualBatch
 
 import geocoder
 import logging
+import numpy as np
+import pandas as pd
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
@@ -16,114 +24,212 @@ def add_reverse_geocode_columns(cache, config, current_df, geocode_function):
         index = max(columns.index(config['lat_column']), columns.index(config['lng_column']))
         current_df = current_df.reindex(columns=columns[:index + 1] + columns_to_append + columns[index + 1:],
                                         copy=False)
-    if not config['batch_enabled']:
-        results = zip(*current_df.apply(perform_reverse_geocode, axis=1, args=(config, geocode_function, cache)))
+    # Geocoding of each distinct location, 1 by 1 or by batch when enabled/available
+    to_geocode, values = perform_reverse_geocode_unique(current_df, config, geocode_function, cache)
 
-        for feature, result in zip(config['features'], results):
-            current_df[feature['column']] = result
-
-    else:
-        batch = []
-
-        for i, row in current_df.iterrows():
-            if len(batch) == config['batch_size']:
-                perform_reverse_geocode_batch(current_df, config, geocode_function, cache, batch)
-                batch = []
-
-            lat = row[config['lat_column']]
-            lng = row[config['lng_column']]
-
-            try:
-                if any([is_empty(row[f['column']]) for f in config['features']]):
-                    res = cache[(lat, lng)]
-                else:
-                    res = {}
-                    for f in config['features']:
-                        res[f['name']] = row[f['column']]
-
-                for feature in config['features']:
-                    current_df.loc[i, feature['column']] = res[feature['name']]
-
-            except KeyError as e:
-                batch.append((i, (lat, lng)))
-
-        if len(batch) > 0:
-            perform_reverse_geocode_batch(current_df, config, geocode_function, cache, batch)
+    for feature in config['features']:
+        set_column_values(current_df, feature['column'], to_geocode, values[feature['name']])
 
     # First loop, we write the schema before creating the dataset writer
     return current_df
 
 
-def get_reverse_geocode_function(config):
+def get_reverse_geocode_function(config, wrap=None):
+    """
+    Geocoding function of the chosen provider, each call to the provider, single query or batch, going through
+    `wrap` if any, such as `RecipeMetrics.wrap`
+    """
+    wrap = wrap or (lambda function: function)
+    if config['provider'] == 'offline':
+        return wrap(GazetteerIndex.load_or_build(config['gazetteer_path']).reverse_geocode)
+
     provider_function = getattr(geocoder, config['provider'])
+    # Keep-alive connections shared by all the queries, concurrent ones included
+    session = get_pooled_session(max(config.get('workers', 1), config.get('batch_concurrency', 1)))
 
     if config['provider'] == 'here':
-        return lambda lat, lng: provider_function([lat, lng], method='reverse', app_id=config['here_app_id'], app_code=config['here_app_code'])
+        geocode_function = lambda lat, lng: provider_function([lat, lng], method='reverse', app_id=config['here_app_id'], app_code=config['here_app_code'], session=session)
     elif config['provider'] == 'google':
-        return lambda lat, lng: provider_function([lat, lng], method='reverse', key=config['api_key'], client=config['google_client'], client_secret=config['google_client_secret'])
-    elif config['batch_enabled']:
-        return lambda locations: provider_function(locations, method='batch_reverse', key=config['api_key'])
+        geocode_function = lambda lat, lng: provider_function([lat, lng], method='reverse', key=config['api_key'], client=config['google_client'], client_secret=config['google_client_secret'], session=session)
+    elif config['batch_enabled'] and not config.get('virtual_batch'):
+        geocode_function = lambda locations: provider_function(locations, method='batch_reverse', key=config['api_key'], session=session)
+        # Failed batches are split and resubmitted, single locations left going to the non-batch endpoint
+        single_function = lambda location: provider_function(list(location), method='reverse', key=config['api_key'], session=session)
+        rate_limiter = RateLimiter(config.get('rate_limit'))
+        return BatchRetry(wrap(rate_limiter.wrap(geocode_function)), wrap(rate_limiter.wrap(single_function)))
     else:
-        return lambda lat, lng: provider_function([lat, lng], method='reverse', key=config['api_key'])
-
-
-def perform_reverse_geocode(df, config, fun, cache):
-    lat = df[config['lat_column']]
-    lng = df[config['lng_column']]
-    res = {'address': None, 'city': None, 'postal': None, 'state': None, 'country': None}
+        geocode_function = lambda lat, lng: provider_function([lat, lng], method='reverse', key=config['api_key'], session=session)
+
+    geocode_function = wrap(RateLimiter(config.get('rate_limit')).wrap(geocode_function))
+    if config['batch_enabled']:
+        # Concurrent single queries behind the interface of the batch endpoints
+        return VirtualBatch(geocode_function, config.get('workers', 1), unpack=True)
+    return geocode_function
+
+
+def perform_reverse_geocode_unique(df, config, fun, cache):
+    """
+    Perform query of the reverse geocoding for the rows of `df` that are not geocoded yet
+
+    Each distinct (lat, lng) location is looked up once in the cache, then once with the geocoding function
+    `fun` if missing (by batches of `config['batch_size']` when batch is enabled), and the results are broadcast
+    to all the rows sharing that location
+
+    :param df:
+    :param config:
+    :param fun:
+    :param cache:
+    :return: boolean mask of the rows to geocode, and a dict of the array of values of each feature for these rows
+    """
+    to_geocode = get_empty_mask(df, [f['column'] for f in config['features']])
+
+    # Python values, as in the rows of the previous releases, keep the cache keys identical to theirs
+    lats = df[config['lat_column']][to_geocode]
+    lngs = df[config['lng_column']][to_geocode]
+    has_location = ~(is_empty_column(lats) | is_empty_column(lngs))
+    lats, lngs = lats.tolist(), lngs.tolist()
+    locations = np.empty(len(lats), dtype=object)
+    for i in np.flatnonzero(has_location):
+        locations[i] = (lats[i], lngs[i])
+    codes, unique_locations = pd.factorize(locations)
+
+    results = resolve_locations(list(unique_locations), config, fun, cache)
+
+    # Rows without location have a -1 code, which picks the trailing empty result
+    values = {}
+    for feature in config['features']:
+        unique_values = np.array([res[feature['name']] if res else None for res in results] + [None], dtype=object)
+        values[feature['name']] = unique_values[codes]
+    return to_geocode, values
+
+
+def resolve_locations(locations, config, fun, cache):
+    """
+    Retrieve the features of distinct (lat, lng) locations, from the cache or with the geocoding function `fun`
+
+    Without batch, up to `config['workers']` queries are in flight, with batch up to `config['batch_concurrency']`
+    batches. Cache lookups and cache writes are done by the calling thread in the order of `locations`, each in a
+    single cache transaction. Results cached by previous releases under numpy values, as they did for dataframes of
+    numeric columns only, are found under these keys, and are stored again under the Python ones
+
+    Locations for which the provider found no match are remembered for `config['no_match_ttl']` seconds and not
+    queried again meanwhile. Failed queries are not remembered
+
+    :param locations: list of distinct (lat, lng) tuples
+    :param config:
+    :param fun:
+    :param cache:
+    :return: list of dicts of features, None for the locations that could not be geocoded
+    """
+    cached = cache.get_many(locations)
+    missed = [position for position, location in enumerate(locations) if location not in cached]
+
+    if missed:
+        cached_numpy = cache.get_many([numpy_location(locations[position]) for position in missed])
+        migrated = [(locations[position], cached_numpy[numpy_location(locations[position])]) for position in missed
+                    if numpy_location(locations[position]) in cached_numpy]
+        cache.set_many(migrated)
+        cached.update(migrated)
+        missed = [position for position in missed if locations[position] not in cached]
+    results = [cached.get(location) for location in locations]
+
+    no_match_ttl = config.get('no_match_ttl', 0)
+    no_matches = set()
+    if no_match_ttl > 0 and missed:
+        no_matches = cache.get_no_matches([locations[position] for position in missed])
+        missed = [position for position in missed if locations[position] not in no_matches]
+
+    if config['batch_enabled']:
+        batches = [[locations[position] for position in missed[start:start + config['batch_size']]]
+                   for start in range(0, len(missed), config['batch_size'])]
+        # Up to `config['batch_concurrency']` batches in flight, merged back in order whatever their completion order
+        outputs = []
+        for batch_outputs in parallel_map(lambda batch: perform_reverse_geocode_batch(batch, fun), batches,
+                                          config.get('batch_concurrency', 1)):
+            outputs += batch_outputs
+    else:
+        outputs = parallel_map(lambda position: geocode_location(locations[position], fun), missed, config.get('workers', 1))
 
-    try:
-        if any([is_empty(df[f['column']]) for f in config['features']]):
-            res = cache[(lat, lng)]
-            logging.info('Hit cache')
+    new_no_matches = []
+    for position, res in zip(missed, outputs):
+        if res is NOT_FOUND:
+            new_no_matches.append(locations[position])
         else:
-            for f in config['features']:
-                res[f['name']] = df[f['column']]
-
-    except KeyError:
-        logging.info('Missed cache')
-        try:
-            out = fun(lat, lng)
-            if not any([out.address, out.city, out.postal, out.state, out.country]):
-                raise Exception('Failed to retrieve coordinates')
-
-            for feature in res.keys():
-                val = getattr(out, feature)
-                res[feature] = val
-
-            cache[(lat, lng)] = res
-        except Exception as e:
-            logging.error("Failed to geocode %s (%s)" % ((lat, lng), e))
-
-    formatted_res = [res[feature['name']] for feature in config['features']]
-
-    return formatted_res
+            results[position] = res
+    cache.set_many([(locations[position], results[position]) for position in missed if results[position]])
+    if no_match_ttl > 0:
+        cache.set_no_matches(new_no_matches, no_match_ttl)
+
+    failed = len([position for position in missed if not results[position]]) - len(new_no_matches)
+    logger.info("Geocoded {} distinct locations, {} from cache, {} without match, {} failed".format(
+        len(locations), len(locations) - len(missed) - len(no_matches), len(no_matches) + len(new_no_matches), failed))
+    return results
+
+
+def numpy_location(location):
+    """
+    (lat, lng) location of numpy values, as keyed in the cache by the releases reading the rows of dataframes of
+    numeric columns only
+    """
+    return tuple([np.array(v)[()] for v in location])
+
+
+def geocode_location(location, fun):
+    """
+    Query the reverse geocoding function `fun` for a single (lat, lng) location
+
+    :param location:
+    :param fun:
+    :return: dict of all the features of the location, NOT_FOUND if the provider found no match, None if the
+    query failed
+    """
+    try:
+        out = fun(location[0], location[1])
+        if not any([out.address, out.city, out.postal, out.state, out.country]):
+            if is_no_match(out):
+                logger.debug("No match for %s" % (location,))
+                return NOT_FOUND
+            raise Exception('Failed to retrieve coordinates')
+
+        res = {}
+        for feature in ['address', 'city', 'postal', 'state', 'country']:
+            res[feature] = getattr(out, feature)
+        return res
+    except Exception as e:
+        logger.debug("Failed to geocode %s (%s)" % (location, e))
+        return None
 
 
-def perform_reverse_geocode_batch(df, config, fun, cache, batch):
+def perform_reverse_geocode_batch(locations, fun):
+    """
+    Query the batch reverse geocoding function `fun` for a list of (lat, lng) locations
 
+    :param locations:
+    :param fun:
+    :return: list of dicts of features, NOT_FOUND for the locations without match in a successful batch, None for
+    the locations that could not be geocoded
+    """
     results = []
     try:
-        results = fun(list(zip(*batch))[1])
+        results = fun(locations)
     except Exception as e:
-        logging.error("Failed to geocode the following batch: %s (%s)" % (batch, e))
+        logger.error("Failed to geocode a batch of %d locations (%s)" % (len(locations), e))
 
-    for out, orig in zip(results, batch):
+    features = [None] * len(locations)
+    for position, (out, loc) in enumerate(zip(results, locations)):
         try:
             if not out.address and not out.city and not out.postal and not out.state and not out.country:
+                if is_answered(results) and is_no_match(out):
+                    logger.debug("No match for %s" % (loc,))
+                    features[position] = NOT_FOUND
+                    continue
                 raise Exception('Failed to retrieve coordinates')
 
-            res = {'address': None, 'city': None, 'postal': None, 'state': None, 'country': None}
-
-            for feature in res.keys():
-                val = getattr(out, feature)
-                res[feature] = val
-
-            i, loc = orig
-            cache[(loc[0], loc[1])] = res
-
-            for feature in config['features']:
-                df.loc[i, feature['column']] = res[feature['name']]
-
+            res = {}
+            for feature in ['address', 'city', 'postal', 'state', 'country']:
+                res[feature] = getattr(out, feature)
+            features[position] = res
         except Exception as e:
-            logging.error("Failed to geocode %s (%s)" % (loc, e))
+            logger.debug("Failed to geocode %s (%s)" % (loc, e))
+
+    return features
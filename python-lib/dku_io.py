@@ -3,13 +3,32 @@
 import logging
 
 from cache_utils import CustomTmpFile
-from geocoder_constants import BATCH_FORWARD_PROVIDERS, BATCH_REVERSED_PROVIDERS
+from geocoder_constants import BATCH_CONCURRENCY, BATCH_FORWARD_PROVIDERS, BATCH_REVERSED_PROVIDERS, \
+    PROVIDER_RATE_LIMITS, DEFAULT_RATE_LIMIT, OFFLINE_BATCH_SIZE, OFFLINE_MIN_SIMILARITY, NO_MATCH_TTL_DAYS, \
+    CHUNK_MEMORY_BUDGET_MB, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, VIRTUAL_BATCH_SIZE
 
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
 
 
+def get_cache_location(plugin_config, forward=True):
+    """
+    Retrieve the location of the forward or reverse geocoding cache
+    :return: whether the default location is used, and the cache location
+    """
+    if plugin_config.get('cache_location', 'original') == 'original':
+        # Detect an empty cache_location in the user settings
+        # Will use the UIF safe cache location by default
+        tmp_cache = CustomTmpFile(sub_directory="forward" if forward else "reverse")
+        persistent_cache_location = tmp_cache.get_user_home_cache_location()
+        logger.info("Using default cache at location {}".format(persistent_cache_location))
+        return True, persistent_cache_location
+    cache_location = plugin_config.get('cache_location_custom', '')
+    logger.info("Using custom cache location {}".format(cache_location))
+    return False, cache_location
+
+
 def get_config_forward_geocoding(plugin_config, recipe_config):
     """
     Retrieve and process the input configuration to determine the geocoding service provider, cache settings and
@@ -23,14 +42,42 @@ def get_config_forward_geocoding(plugin_config, recipe_config):
     if processed_config['provider'] is None:
         raise AttributeError('Please select a geocoding provider.')
 
-    processed_config['batch_enabled'] = recipe_config.get('batch_enabled', False) \
-        and processed_config['provider'] in BATCH_FORWARD_PROVIDERS
+    processed_config['batch_enabled'] = recipe_config.get('batch_enabled', False)
+    # Providers without batch endpoint answer virtual batches of concurrent single queries
+    processed_config['virtual_batch'] = processed_config['provider'] not in BATCH_FORWARD_PROVIDERS
 
     processed_config['batch_size'] = {
         'bing': recipe_config.get('batch_size_bing', 50),
         'mapquest': 100,
         'uscensus': recipe_config.get('batch_size_uscensus', 1000)
-    }.get(processed_config['provider'], 0)
+    }.get(processed_config['provider'], VIRTUAL_BATCH_SIZE)
+    # Virtual batches already send their queries concurrently
+    processed_config['batch_concurrency'] = 1 if processed_config['virtual_batch'] else \
+        recipe_config.get('batch_concurrency') or BATCH_CONCURRENCY.get(processed_config['provider'], 1)
+
+    processed_config['workers'] = max(1, recipe_config.get('workers', 1) or 1)
+    processed_config['processes'] = max(1, recipe_config.get('processes', 1) or 1)
+    processed_config['chunk_memory_mb'] = recipe_config.get('chunk_memory_mb') or CHUNK_MEMORY_BUDGET_MB
+    processed_config['min_chunk_size'] = recipe_config.get('min_chunk_size') or MIN_CHUNK_SIZE
+    processed_config['max_chunk_size'] = recipe_config.get('max_chunk_size') or MAX_CHUNK_SIZE
+    processed_config['rate_limit'] = recipe_config.get('rate_limit') or \
+        PROVIDER_RATE_LIMITS.get(processed_config['provider'], DEFAULT_RATE_LIMIT)
+    processed_config['address_normalization'] = recipe_config.get('address_normalization', 'none')
+
+    if processed_config['provider'] == 'offline':
+        for param in ['reference_address_column', 'reference_lat_column', 'reference_lng_column']:
+            processed_config[param] = recipe_config.get(param)
+            if not processed_config[param]:
+                raise AttributeError('Please select the address, latitude and longitude columns of the reference dataset.')
+        processed_config['min_similarity'] = recipe_config.get('min_similarity') or OFFLINE_MIN_SIMILARITY
+        processed_config['fallback_provider'] = recipe_config.get('fallback_provider') or None
+        processed_config['rate_limit'] = recipe_config.get('rate_limit') or \
+            PROVIDER_RATE_LIMITS.get(processed_config['fallback_provider'], DEFAULT_RATE_LIMIT)
+        # Whole chunks are looked up at once in the local index. Its matches are kept out of the cache shared with the
+        # remote providers, whose results would otherwise hide the reference dataset
+        processed_config['batch_enabled'] = True
+        processed_config['batch_size'] = OFFLINE_BATCH_SIZE
+        processed_config['cache_enabled'] = False
 
     processed_config['batch_timeout'] = {
         'bing': 10,
@@ -38,21 +85,17 @@ def get_config_forward_geocoding(plugin_config, recipe_config):
         'uscensus': 1800
     }.get(processed_config['provider'], 0)
 
-    if plugin_config.get('cache_location', 'original') == 'original':
-        # Detect an empty cache_location in the user settings
-        # Will use the UIF safe cache location by default
-        tmp_cache = CustomTmpFile(sub_directory="forward")
-        processed_config['using_default_cache'] = True
-        persistent_cache_location = tmp_cache.get_user_home_cache_location()
-        processed_config['cache_location'] = persistent_cache_location
-        logger.info("Using default cache at location {}".format(persistent_cache_location))
-    else:
-        processed_config['using_default_cache'] = False
-        processed_config['cache_location'] = plugin_config.get('cache_location_custom', '')
-        logger.info("Using custom cache location {}".format(processed_config['cache_location']))
+    processed_config['using_default_cache'], processed_config['cache_location'] = get_cache_location(plugin_config, forward=True)
+    processed_config['cache_backend'] = plugin_config.get('cache_backend', 'disk')
+    processed_config['redis_url'] = plugin_config.get('redis_url')
 
     processed_config['cache_size'] = plugin_config.get('forward_cache_size', 1000) * 1000
     processed_config['cache_eviction'] = plugin_config.get('forward_cache_policy', 'least-recently-stored')
+    processed_config['cache_memory_size'] = plugin_config.get('forward_memory_cache_size', 100000)
+    no_match_ttl_days = recipe_config.get('no_match_ttl_days', NO_MATCH_TTL_DAYS)
+    processed_config['no_match_ttl'] = no_match_ttl_days * 24 * 3600 if no_match_ttl_days else 0
+    processed_config['incremental'] = recipe_config.get('incremental', False)
+    processed_config['incremental_key_columns'] = recipe_config.get('incremental_key_columns') or []
 
     prefix = recipe_config.get('column_prefix', '')
     for column_name in ['latitude', 'longitude']:
@@ -76,9 +119,30 @@ def get_config_reverse_geocoding(plugin_config, recipe_config):
     if processed_config['provider'] is None:
         raise AttributeError('Please select a geocoding provider.')
 
-    processed_config['batch_enabled'] = recipe_config.get('batch_enabled', False) \
-        and processed_config['provider'] in BATCH_REVERSED_PROVIDERS
-    processed_config['batch_size'] = recipe_config.get('batch_size_bing', 50)
+    processed_config['batch_enabled'] = recipe_config.get('batch_enabled', False)
+    # Providers without batch endpoint answer virtual batches of concurrent single queries
+    processed_config['virtual_batch'] = processed_config['provider'] not in BATCH_REVERSED_PROVIDERS
+    processed_config['batch_size'] = recipe_config.get('batch_size_bing', 50) if processed_config['provider'] == 'bing' \
+        else VIRTUAL_BATCH_SIZE
+    processed_config['batch_concurrency'] = 1 if processed_config['virtual_batch'] else \
+        recipe_config.get('batch_concurrency') or BATCH_CONCURRENCY.get(processed_config['provider'], 1)
+    processed_config['cache_tolerance'] = recipe_config.get('cache_tolerance') or 0
+    processed_config['workers'] = max(1, recipe_config.get('workers', 1) or 1)
+    processed_config['processes'] = max(1, recipe_config.get('processes', 1) or 1)
+    processed_config['chunk_memory_mb'] = recipe_config.get('chunk_memory_mb') or CHUNK_MEMORY_BUDGET_MB
+    processed_config['min_chunk_size'] = recipe_config.get('min_chunk_size') or MIN_CHUNK_SIZE
+    processed_config['max_chunk_size'] = recipe_config.get('max_chunk_size') or MAX_CHUNK_SIZE
+    processed_config['rate_limit'] = recipe_config.get('rate_limit') or \
+        PROVIDER_RATE_LIMITS.get(processed_config['provider'], DEFAULT_RATE_LIMIT)
+
+    if processed_config['provider'] == 'offline':
+        processed_config['gazetteer_path'] = recipe_config.get('gazetteer_path')
+        if not processed_config['gazetteer_path']:
+            raise AttributeError('Please provide the path of the gazetteer file.')
+        # Whole chunks are looked up at once in the local index, which is faster than any cache
+        processed_config['batch_enabled'] = True
+        processed_config['batch_size'] = OFFLINE_BATCH_SIZE
+        processed_config['cache_enabled'] = False
 
     processed_config['features'] = []
     prefix = recipe_config.get('column_prefix', '')
@@ -87,21 +151,17 @@ def get_config_reverse_geocoding(plugin_config, recipe_config):
         if recipe_config.get(feature, False):
             processed_config['features'].append({'name': feature, 'column': prefix + feature})
 
-    if plugin_config.get('cache_location', 'original') == 'original':
-        # Detect an empty cache_location in the user settings
-        # Will use the UIF safe cache location by default
-        tmp_cache = CustomTmpFile(sub_directory="reverse")
-        processed_config['using_default_cache'] = True
-        persistent_cache_location = tmp_cache.get_user_home_cache_location()
-        processed_config['cache_location'] = persistent_cache_location
-        logger.info("Using default cache at location {}".format(persistent_cache_location))
-    else:
-        processed_config['using_default_cache'] = False
-        processed_config['cache_location'] = plugin_config.get('cache_location_custom', '')
-        logger.info("Using custom cache location {}".format(processed_config['cache_location']))
+    processed_config['using_default_cache'], processed_config['cache_location'] = get_cache_location(plugin_config, forward=False)
+    processed_config['cache_backend'] = plugin_config.get('cache_backend', 'disk')
+    processed_config['redis_url'] = plugin_config.get('redis_url')
 
     processed_config['cache_size'] = plugin_config.get('reverse_cache_size', 1000) * 1000
     processed_config['cache_eviction'] = plugin_config.get('reverse_cache_policy', 'least-recently-stored')
+    processed_config['cache_memory_size'] = plugin_config.get('reverse_memory_cache_size', 100000)
+    no_match_ttl_days = recipe_config.get('no_match_ttl_days', NO_MATCH_TTL_DAYS)
+    processed_config['no_match_ttl'] = no_match_ttl_days * 24 * 3600 if no_match_ttl_days else 0
+    processed_config['incremental'] = recipe_config.get('incremental', False)
+    processed_config['incremental_key_columns'] = recipe_config.get('incremental_key_columns') or []
 
     if len(processed_config['features']) == 0:
         raise AttributeError('Please select at least one feature to extract.')
@@ -7,3 +7,103 @@ BATCH_FORWARD_PROVIDERS = [
 BATCH_REVERSED_PROVIDERS = [
     'bing'
 ]
+
+# Default maximum number of batches submitted concurrently to the providers with a batch endpoint
+BATCH_CONCURRENCY = {
+    'bing': 2,
+    'mapquest': 2,
+    'uscensus': 4
+}
+
+# Number of queries of a virtual batch, sent concurrently to providers without batch endpoint
+VIRTUAL_BATCH_SIZE = 1000
+
+# Number of locations or addresses looked up at once in the index of the offline providers
+OFFLINE_BATCH_SIZE = 10000
+
+# Maximum number of (location, place) pairs whose distance is computed at once by the offline reverse provider
+OFFLINE_MAX_CANDIDATES = 1000000
+
+# Minimum trigram similarity of an address to a reference address for the offline provider to match them
+OFFLINE_MIN_SIMILARITY = 0.8
+
+# Errors of the providers answering a query without match, the other errors being transient failures
+PROVIDER_NO_MATCH_ERRORS = {
+    'google': ['ZERO_RESULTS']
+}
+
+# Default maximum number of queries per second, following the usage policy of each provider
+PROVIDER_RATE_LIMITS = {
+    'bing': 5,
+    'geonames': 0.25,
+    'google': 50,
+    'here': 5,
+    'komoot': 1,
+    'locationiq': 2,
+    'mapbox': 10,
+    'mapquest': 10,
+    'opencage': 1,
+    'osm': 1,
+    'tomtom': 5
+}
+
+DEFAULT_RATE_LIMIT = 10
+
+# Maximum number of additional provider calls spent resubmitting the parts of a failed batch
+BATCH_RETRY_BUDGET = 32
+# Seconds waited before the first resubmission of a failed batch, doubled at each split, up to the maximum delay
+BATCH_RETRY_BACKOFF = 1.
+BATCH_RETRY_MAX_DELAY = 60.
+
+THROTTLING_STATUS_CODES = [
+    429,
+    503
+]
+
+# Bump when the address normalization changes, so that previous normalized cache keys are not reused
+ADDRESS_NORMALIZATION_VERSION = 1
+
+STREET_ABBREVIATIONS = {
+    'alley': 'aly',
+    'avenue': 'ave',
+    'boulevard': 'blvd',
+    'circle': 'cir',
+    'court': 'ct',
+    'crescent': 'cres',
+    'drive': 'dr',
+    'east': 'e',
+    'expressway': 'expy',
+    'freeway': 'fwy',
+    'highway': 'hwy',
+    'lane': 'ln',
+    'north': 'n',
+    'northeast': 'ne',
+    'northwest': 'nw',
+    'parkway': 'pkwy',
+    'place': 'pl',
+    'road': 'rd',
+    'route': 'rte',
+    'south': 's',
+    'southeast': 'se',
+    'southwest': 'sw',
+    'square': 'sq',
+    'street': 'st',
+    'terrace': 'ter',
+    'west': 'w'
+}
+
+# Default number of days during which addresses and locations without match are not queried again
+NO_MATCH_TTL_DAYS = 30
+
+# Number of chunks read ahead of, and waiting to be written behind, the chunk being geocoded
+PIPELINE_QUEUE_SIZE = 1
+
+# Bounds and initial number of rows of the chunks of the input dataset, resized within the memory budget
+MIN_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 500000
+INITIAL_CHUNK_SIZE = 10000
+CHUNK_MEMORY_BUDGET_MB = 512
+# Chunks held in memory at once by the pipeline, counting the copies made while geocoding and writing one
+CHUNK_MEMORY_COPIES = 6
+# Chunks are resized to be geocoded in about that many seconds, growing by at most a factor 2 at a time
+CHUNK_TARGET_SECONDS = 60
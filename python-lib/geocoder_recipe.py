@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 
 import dataiku
+import json
 import logging
+import time
 
 from dataiku.customrecipe import get_input_names_for_role, get_output_names_for_role
 from dataiku.customrecipe import get_plugin_config, get_recipe_config
-from cache_handler import CacheHandler
-from dataframe_reverse_geocoding import add_reverse_geocode_columns, get_reverse_geocode_function
-from dataframe_forward_geocoding import get_forward_geocode_function, add_forward_geocode_columns
+from chunk_geocoder import geocode_chunks
 from dku_io import get_config_reverse_geocoding, get_config_forward_geocoding
+from chunk_sizer import ChunkSizer, rechunk
+from geocoder_constants import CHUNK_MEMORY_COPIES, INITIAL_CHUNK_SIZE, PIPELINE_QUEUE_SIZE
+from incremental import GeocodedKeys, get_key_columns
+from parallel_utils import END, BackgroundWriter, prefetch
+from recipe_metrics import RecipeMetrics
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
@@ -23,19 +28,99 @@ def geocoder_recipe(forward=True):
     plugin_config = get_plugin_config()
 
     config = get_config_forward_geocoding(recipe_config=recipe_config, plugin_config=plugin_config) if forward else get_config_reverse_geocoding(recipe_config=recipe_config, plugin_config=plugin_config)
-    geocode_function = get_forward_geocode_function(config) if forward else get_reverse_geocode_function(config)
+    reference_df = get_reference_dataframe(config) if forward else None
 
+    metrics = RecipeMetrics()
     writer = None
 
-    with CacheHandler(config['cache_location'], enabled=config['cache_enabled'], size_limit=config['cache_size'],
-                      eviction_policy=config['cache_eviction']) as cache:
-        for current_df in input_dataset.iter_dataframes(chunksize=max(10000, config['batch_size'])):
-            current_df = add_forward_geocode_columns(cache, config, current_df, geocode_function) if forward else add_reverse_geocode_columns(cache, config, current_df, geocode_function)
+    geocoded_keys, key_columns = None, None
+    if config['incremental']:
+        key_columns = get_key_columns(config, [column['name'] for column in input_dataset.read_schema()], forward)
+        geocoded_keys = load_geocoded_keys(output_dataset, key_columns)
+        # New rows are appended to the existing output
+        output_dataset.spec_item['appendMode'] = True
+
+    sizer = get_chunk_sizer(config)
+    chunks = read_chunks(input_dataset, sizer, geocoded_keys, key_columns)
+    for current_df, chunk, latencies, errors in geocode_chunks(chunks, forward, config, config['processes'], reference_df):
+        start = time.time()
+        if len(current_df):
             # First loop, we write the schema before creating the dataset writer
             if writer is None:
                 output_dataset.write_schema_from_dataframe(current_df)
-                writer = output_dataset.get_writer()
+                writer = BackgroundWriter(output_dataset.get_writer(), PIPELINE_QUEUE_SIZE)
             writer.write_dataframe(current_df)
+        chunk['write'] = time.time() - start
+        metrics.add_chunk(chunk, latencies, errors)
+        sizer.update(chunk['rows'], chunk['wall'])
 
     if writer is not None:
         writer.close()
+
+    logger.info("Run metrics: {}".format(json.dumps(metrics.summary(), sort_keys=True)))
+    metrics_names = get_output_names_for_role('metrics_ds')
+    if metrics_names:
+        dataiku.Dataset(metrics_names[0]).write_with_schema(metrics.to_dataframe())
+
+
+def get_chunk_sizer(config):
+    """
+    Chunk sizer of the recipe, the chunks geocoded in worker processes and their copies counting in its memory budget
+    """
+    chunks_in_memory = CHUNK_MEMORY_COPIES + 2 * PIPELINE_QUEUE_SIZE
+    if config['processes'] > 1:
+        chunks_in_memory += 4 * config['processes']
+    # Chunks hold at least one batch of the provider
+    min_size = max(config['min_chunk_size'], config['batch_size'])
+    return ChunkSizer(config['chunk_memory_mb'] * 1e6, min_size, config['max_chunk_size'],
+                      max(INITIAL_CHUNK_SIZE, config['batch_size']), chunks_in_memory)
+
+
+def read_chunks(input_dataset, sizer, geocoded_keys=None, key_columns=None):
+    """
+    Read the input dataset by chunks sized by `sizer`, without the rows already geocoded in incremental mode
+    :return: generator of tuples of a chunk and its read metrics
+    """
+    # Reading the next chunks overlaps with the geocoding of the current one
+    chunks = prefetch(rechunk(input_dataset.iter_dataframes(chunksize=sizer.min_size), sizer), PIPELINE_QUEUE_SIZE)
+    while True:
+        start = time.time()
+        current_df = next(chunks, END)
+        if current_df is END:
+            return
+        stats = {'read': time.time() - start, 'skipped': 0}
+
+        if geocoded_keys is not None:
+            already_geocoded = geocoded_keys.contains(current_df, key_columns)
+            stats['skipped'] = int(already_geocoded.sum())
+            if stats['skipped']:
+                current_df = current_df[~already_geocoded]
+        yield current_df, stats
+
+
+def load_geocoded_keys(output_dataset, key_columns):
+    """
+    Load the keys of the rows of the existing output dataset, restricted to the partition being built if any
+    """
+    write_partition = getattr(output_dataset, 'writePartition', None)
+    if write_partition:
+        output_dataset.add_read_partitions(write_partition)
+    try:
+        return GeocodedKeys.from_dataframes(output_dataset.iter_dataframes(columns=key_columns, chunksize=100000), key_columns)
+    except Exception as e:
+        # First build, or key columns missing from the output
+        logger.warning("Could not read the existing output, all rows will be geocoded ({})".format(e))
+        return GeocodedKeys()
+
+
+def get_reference_dataframe(config):
+    """
+    Read the reference addresses of the offline forward geocoding provider
+    """
+    if config['provider'] != 'offline':
+        return None
+    reference_names = get_input_names_for_role('reference_ds')
+    if not reference_names:
+        raise AttributeError('Please add a reference dataset of geocoded addresses to use the offline provider.')
+    columns = [config['reference_address_column'], config['reference_lat_column'], config['reference_lng_column']]
+    return dataiku.Dataset(reference_names[0]).get_dataframe(columns=columns)
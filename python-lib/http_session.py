@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+
+def get_pooled_session(pool_size=1):
+    """
+    Return an HTTP session to be shared by all the queries sent to a provider
+
+    Connections are kept alive between queries, so that only the first query to a host pays the TCP and TLS
+    setup. Up to `pool_size` connections are kept per host, one for each thread sending queries.
+    :param pool_size: maximum number of concurrent queries
+    :return: requests session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(1, pool_size))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
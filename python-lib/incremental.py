@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+
+def get_key_columns(config, input_columns, forward=True):
+    """
+    Columns identifying a row, the configured ones or by default all the input columns but the geocoding results
+
+    Input columns named as the geocoding results are left out of the default key, their values being empty in the
+    input but filled in the output.
+    :param config: processed recipe configuration
+    :param input_columns: names of the columns of the input dataset
+    :param forward: forward or reverse geocoding
+    :return: list of column names
+    """
+    if config['incremental_key_columns']:
+        return config['incremental_key_columns']
+    if forward:
+        result_columns = [config['latitude'], config['longitude']]
+    else:
+        result_columns = [feature['column'] for feature in config['features']]
+    return [column for column in input_columns if column not in result_columns]
+
+
+def format_key_column(column):
+    """
+    String values of a key column, formatted alike whatever the dtype pandas inferred for the chunk it was read in
+
+    Integral numbers are formatted without decimal part, so that an integer column read as float in a chunk holding
+    missing values keeps the same values, and missing values are formatted as empty strings.
+    :param column: series
+    :return: array of strings
+    """
+    missing = pd.isnull(column).values
+    if column.dtype.kind in 'iuf':
+        numbers = column.values.astype(np.float64)
+        values = np.array(column.astype(np.float64).astype(str), dtype=object)
+        integral = ~missing & (np.abs(numbers) < 2 ** 53)
+        integral[integral] = numbers[integral] == np.floor(numbers[integral])
+        values[integral] = numbers[integral].astype(np.int64).astype(str)
+    else:
+        values = np.array(column.astype(str), dtype=object)
+    values[missing] = ''
+    return values
+
+
+def hash_rows(df, key_columns):
+    """
+    64 bits hash of the key of each row of `df`
+
+    Values are hashed as strings formatted by `format_key_column`, so that the rows read back from the output
+    dataset, whose types may have been inferred differently, hash like the input rows they come from
+    :param df:
+    :param key_columns: columns identifying a row
+    :return: array of uint64
+    """
+    keys = pd.DataFrame(dict([(str(position), format_key_column(df[column]))
+                              for position, column in enumerate(key_columns)]), index=df.index)
+    return pd.util.hash_pandas_object(keys, index=False).values.astype(np.uint64)
+
+
+class GeocodedKeys(object):
+    """
+    Compact set of the keys of the rows already geocoded, held as a sorted array of their 64 bits hashes
+
+    50 million rows take 400 MB, whatever the number and size of the key columns.
+    """
+
+    def __init__(self, hashes=None):
+        self.hashes = np.unique(hashes) if hashes is not None else np.array([], dtype=np.uint64)
+
+    @classmethod
+    def from_dataframes(cls, dataframes, key_columns):
+        """
+        Load the keys of the rows of an iterable of dataframes, typically the chunks of the existing output dataset
+        """
+        hashes = [np.unique(hash_rows(df, key_columns)) for df in dataframes]
+        keys = cls(np.concatenate(hashes) if hashes else None)
+        logger.info("Loaded {} keys of rows already geocoded".format(len(keys)))
+        return keys
+
+    def contains(self, df, key_columns):
+        """
+        :return: boolean mask of the rows of `df` whose key is in the set
+        """
+        hashes = hash_rows(df, key_columns)
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return self.hashes[positions] == hashes
+
+    def __len__(self):
+        return len(self.hashes)
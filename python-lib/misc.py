@@ -1,7 +1,70 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+import pandas as pd
+
+from geocoder_constants import PROVIDER_NO_MATCH_ERRORS
+
+# Result of a query which the provider answered without match, as opposed to None for a failed query
+NOT_FOUND = object()
+
+NO_MATCH_ERRORS = set([error for errors in PROVIDER_NO_MATCH_ERRORS.values() for error in errors])
 
 
 def is_empty(val):
     return np.isnan(val) if isinstance(val, float) else not val
+
+
+def is_empty_column(column):
+    """
+    Vectorized `is_empty` of each value of the series `column`
+    :return: boolean array
+    """
+    kind = getattr(column.dtype, 'kind', 'O')
+    if kind == 'f':
+        return np.isnan(np.asarray(column, dtype=float))
+    if kind in 'iub':
+        return np.asarray(column) == 0
+    values = np.asarray(column, dtype=object)
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        # None, NaN or empty string, without a Python call per value
+        return np.asarray(pd.isnull(values) | (values == ''), dtype=bool)
+    return np.array([is_empty(v) for v in values], dtype=bool)
+
+
+def get_empty_mask(df, columns):
+    """
+    Boolean mask of the rows of `df` with an empty value in at least one of `columns`, computed column by column
+    """
+    mask = np.zeros(len(df), dtype=bool)
+    for column in columns:
+        mask |= is_empty_column(df[column])
+    return mask
+
+
+def set_column_values(df, column, mask, values):
+    """
+    Assign `values` to the rows of `df[column]` selected by the boolean array `mask`, in a single assignment
+    """
+    if not mask.any():
+        return
+    column_values = np.array(df[column], dtype=object)
+    column_values[mask] = values
+    df[column] = pd.Series(column_values, index=df.index).infer_objects()
+
+
+def is_answered(out):
+    """
+    Tell whether the provider answered a query, with or without match, or with one of its errors meaning no match
+    (ZERO_RESULTS of Google...), rather than failing with a transient error (network, throttling, quota...)
+    """
+    error = getattr(out, 'error', False)
+    return getattr(out, 'status_code', 200) == 200 and (not error or error in NO_MATCH_ERRORS)
+
+
+def is_no_match(out):
+    """
+    Tell whether a geocoding result without coordinates or features is a permanent absence of match, the provider
+    having answered the query, rather than a transient error
+    """
+    return is_answered(out)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+from address_normalizer import normalize_address
+from geocoder_constants import OFFLINE_MIN_SIMILARITY
+from offline_index import get_index_dir, is_saved, load_arrays, save_arrays
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+OfflineMatch = collections.namedtuple('OfflineMatch', ['lat', 'lng', 'score'])
+NO_MATCH = OfflineMatch(None, None, 0.)
+
+INDEX_VERSION = 1
+# Trigrams shared by more reference addresses than this are too common to select candidates ('st ', ' ma'...)
+MAX_POSTINGS = 10000
+# Number of candidates sharing the most trigrams with an address that are scored
+MAX_CANDIDATES = 10
+
+
+def get_tokens(address):
+    """
+    Normalized form of an address indexed and looked up, without the prefix of the cache keys
+    """
+    return normalize_address(address, 'full').split('|', 1)[1]
+
+
+def get_trigrams(tokens):
+    padded = ' {} '.format(tokens)
+    return set([padded[i:i + 3] for i in range(len(padded) - 2)])
+
+
+class AddressIndex(object):
+    """
+    Lookup of addresses in a reference table of geocoded addresses, by normalized tokens
+
+    An address is matched, in that order of preference:
+    - exactly, once normalized
+    - by prefix, when it is the beginning of a single reference address ('10 downing st' for '10 downing st london')
+    - by trigram similarity, to the reference address with the highest Jaccard index of trigrams, if at least
+    `min_similarity`
+
+    Reference addresses are stored sorted, along with a posting list of the addresses of each trigram. All arrays
+    are stored as .npy files and memory-mapped when loaded.
+    """
+
+    def __init__(self, arrays, min_similarity=OFFLINE_MIN_SIMILARITY):
+        self.arrays = arrays
+        self.min_similarity = min_similarity
+
+    @classmethod
+    def build(cls, addresses, lats, lngs):
+        """
+        Build the index of reference addresses, the first coordinates being kept for duplicated addresses
+
+        :param addresses: iterable of addresses
+        :param lats: iterable of the latitude of each address
+        :param lngs: iterable of the longitude of each address
+        """
+        reference = pd.DataFrame({
+            'tokens': [get_tokens(address) for address in addresses],
+            'lat': pd.to_numeric(pd.Series(list(lats)), errors='coerce').values,
+            'lng': pd.to_numeric(pd.Series(list(lngs)), errors='coerce').values
+        })
+        reference = reference[(reference['tokens'] != '') & np.isfinite(reference['lat']) & np.isfinite(reference['lng'])]
+        reference = reference.drop_duplicates('tokens').sort_values('tokens')
+
+        tokens = reference['tokens'].tolist()
+        trigrams, rows = [], []
+        for row, address_tokens in enumerate(tokens):
+            address_trigrams = get_trigrams(address_tokens)
+            trigrams += address_trigrams
+            rows += [row] * len(address_trigrams)
+        trigram_codes, unique_trigrams = pd.factorize(np.asarray(trigrams, dtype=object), sort=True)
+        order = np.argsort(trigram_codes, kind='mergesort')
+
+        arrays = {
+            # Fixed width unicode arrays, unlike object arrays, can be memory-mapped
+            'tokens': np.asarray(tokens, dtype=str),
+            'lat': reference['lat'].values.astype(float),
+            'lng': reference['lng'].values.astype(float),
+            'trigrams': np.asarray(unique_trigrams, dtype=str),
+            'offsets': np.searchsorted(trigram_codes[order], np.arange(len(unique_trigrams) + 1)),
+            'postings': np.asarray(rows, dtype=np.int64)[order]
+        }
+        logger.info("Indexed {} distinct reference addresses".format(len(tokens)))
+        return cls(arrays)
+
+    def save(self, index_dir):
+        save_arrays(index_dir, self.arrays, {'version': INDEX_VERSION})
+
+    @classmethod
+    def load(cls, index_dir):
+        arrays, _ = load_arrays(index_dir)
+        return cls(arrays)
+
+    @classmethod
+    def load_or_build(cls, reference_df, address_column, lat_column, lng_column, index_dir=None):
+        """
+        Load the index of a reference table, building it the first time or when the table content changed
+
+        :param reference_df: dataframe of the reference addresses and their coordinates
+        """
+        reference_df = reference_df[[address_column, lat_column, lng_column]]
+        if index_dir is None:
+            signature = hashlib.sha1('{}|'.format(INDEX_VERSION).encode('utf-8'))
+            signature.update(pd.util.hash_pandas_object(reference_df, index=False).values.tobytes())
+            index_dir = get_index_dir('forward-' + signature.hexdigest())
+
+        if not is_saved(index_dir):
+            cls.build(reference_df[address_column], reference_df[lat_column], reference_df[lng_column]).save(index_dir)
+        logger.info("Loading reference address index from {}".format(index_dir))
+        return cls.load(index_dir)
+
+    def _match_trigrams(self, tokens):
+        """
+        Find the reference address most similar to `tokens`
+        :return: position of the reference address and its similarity, -1 if none is similar enough
+        """
+        trigrams = get_trigrams(tokens)
+        queried = np.asarray(sorted(trigrams), dtype=str)
+        positions = np.minimum(np.searchsorted(self.arrays['trigrams'], queried), len(self.arrays['trigrams']) - 1)
+        positions = positions[self.arrays['trigrams'][positions] == queried]
+        if len(positions) == 0:
+            return -1, 0.
+
+        starts, ends = self.arrays['offsets'][positions], self.arrays['offsets'][positions + 1]
+        selective = (ends - starts) <= MAX_POSTINGS
+        if not selective.any():
+            selective = (ends - starts) == (ends - starts).min()
+        postings = np.concatenate([self.arrays['postings'][start:end] for start, end in zip(starts[selective], ends[selective])])
+        candidates, shared = np.unique(postings, return_counts=True)
+        candidates = candidates[np.argsort(-shared, kind='mergesort')[:MAX_CANDIDATES]]
+
+        best, best_similarity = -1, 0.
+        for candidate in candidates:
+            candidate_trigrams = get_trigrams(self.arrays['tokens'][candidate])
+            similarity = len(trigrams & candidate_trigrams) / float(len(trigrams | candidate_trigrams))
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        if best_similarity < self.min_similarity:
+            return -1, best_similarity
+        return best, best_similarity
+
+    def geocode(self, addresses):
+        """
+        Batch forward geocoding function of the offline provider
+
+        :param addresses: list of addresses
+        :return: list of OfflineMatch, NO_MATCH for the addresses not found in the reference table
+        """
+        tokens = np.asarray([get_tokens(address) for address in addresses], dtype=str)
+        reference = self.arrays['tokens']
+        matches = np.full(len(tokens), -1, dtype=np.int64)
+        scores = np.zeros(len(tokens))
+        if len(tokens) == 0 or len(reference) == 0:
+            return [NO_MATCH] * len(tokens)
+
+        # Exact matches, then unique prefix matches on whole tokens
+        positions = np.minimum(np.searchsorted(reference, tokens), len(reference) - 1)
+        exact = (reference[positions] == tokens) & (tokens != '')
+        matches[exact], scores[exact] = positions[exact], 1.
+
+        remaining = np.flatnonzero(~exact & (tokens != ''))
+        if len(remaining):
+            prefixes = np.char.add(tokens[remaining], ' ')
+            starts = np.searchsorted(reference, prefixes, side='left')
+            ends = np.searchsorted(reference, np.char.add(prefixes, u'\U0010ffff'), side='left')
+            unique_prefix = (ends - starts) == 1
+            matches[remaining[unique_prefix]], scores[remaining[unique_prefix]] = starts[unique_prefix], 1.
+            remaining = remaining[~unique_prefix]
+
+        for position in remaining:
+            matches[position], scores[position] = self._match_trigrams(tokens[position])
+
+        return [OfflineMatch(self.arrays['lat'][match], self.arrays['lng'][match], score) if match >= 0 else NO_MATCH
+                for match, score in zip(matches, scores)]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from cache_utils import CustomTmpFile
+
+
+def get_index_dir(name):
+    """
+    Location of the offline index `name`, in the per user cache location of the plugin
+    """
+    return os.path.join(CustomTmpFile(sub_directory='offline').get_user_home_cache_location(), name)
+
+
+def save_arrays(index_dir, arrays, meta):
+    """
+    Write the NumPy `arrays` of an index and its `meta` data to `index_dir`
+
+    The index is written to a temporary folder renamed once complete, so that concurrent recipes never load a
+    partial index
+    :param index_dir:
+    :param arrays: dict of arrays, object arrays are not supported as they can't be memory-mapped
+    :param meta: JSON serializable dict
+    """
+    parent_dir = os.path.dirname(os.path.abspath(index_dir))
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), array)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(dict(meta, arrays=list(arrays)), f)
+    try:
+        os.rename(tmp_dir, index_dir)
+    except OSError:
+        # Index saved in the meantime by another recipe
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_arrays(index_dir):
+    """
+    Open an index saved by `save_arrays`, its arrays being memory-mapped
+
+    :return: dict of arrays, and meta data
+    """
+    with open(os.path.join(index_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r') for name in meta['arrays']}
+    return arrays, meta
+
+
+def is_saved(index_dir):
+    return os.path.exists(os.path.join(index_dir, 'meta.json'))
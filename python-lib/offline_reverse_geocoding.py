@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from geocoder_constants import OFFLINE_MAX_CANDIDATES
+from offline_index import get_index_dir, is_saved, load_arrays, save_arrays
+from spatial_cache import EARTH_RADIUS
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+OfflineResult = collections.namedtuple('OfflineResult', ['address', 'city', 'postal', 'state', 'country'])
+
+# Column positions of the features in the GeoNames dumps, identified by their number of columns. The country is
+# the ISO 3166 code in both dumps, and the state the admin1 code in the places dump (admin1CodesASCII.txt gives
+# their names) but the admin1 name in the postal codes dump
+GEONAMES_FORMATS = {
+    # http://download.geonames.org/export/dump/ (cities500.txt, cities1000.txt, allCountries.txt...)
+    19: {'lat': 4, 'lng': 5, 'city': 1, 'state': 10, 'country': 8, 'feature_class': 6},
+    # http://download.geonames.org/export/zip/ (allCountries.txt, FR.txt...)
+    12: {'lat': 9, 'lng': 10, 'city': 2, 'postal': 1, 'state': 3, 'country': 0}
+}
+# Feature class of the populated places (cities, villages...), the places dumps also listing lakes, hills, roads...
+POPULATED_PLACE_CLASS = 'P'
+FEATURES = ['city', 'postal', 'state', 'country']
+INDEX_VERSION = 2
+
+
+class GazetteerIndex(object):
+    """
+    Nearest place lookup over a gazetteer, places being sorted by the grid cell of `cell_size` degrees they belong to
+
+    Arrays are stored as .npy files and memory-mapped when loaded, so that opening an index is immediate
+    whatever its size.
+    """
+
+    def __init__(self, arrays, cell_size):
+        self.arrays = arrays
+        self.cell_size = cell_size
+        self.max_candidates = OFFLINE_MAX_CANDIDATES
+        self.lat_cells = int(np.ceil(180. / cell_size)) + 1
+        self.lng_cells = int(np.ceil(360. / cell_size))
+
+    def _cell_keys(self, lats, lngs, lat_offset=0, lng_offset=0):
+        i = np.clip(np.floor((lats + 90.) / self.cell_size).astype(np.int64) + lat_offset, 0, self.lat_cells - 1)
+        j = (np.floor((lngs + 180.) / self.cell_size).astype(np.int64) + lng_offset) % self.lng_cells
+        return i * self.lng_cells + j
+
+    @classmethod
+    def build(cls, gazetteer_path, cell_size=0.5):
+        """
+        Build the index of a GeoNames tab separated file, either a places or a postal codes dump, keeping only the
+        populated places of a places dump
+        """
+        n_columns = len(pd.read_csv(gazetteer_path, sep='\t', header=None, quoting=3, nrows=1).columns)
+        if n_columns not in GEONAMES_FORMATS:
+            raise ValueError('Unsupported gazetteer format with {} columns, expected a GeoNames dump'.format(n_columns))
+        positions = GEONAMES_FORMATS[n_columns]
+
+        df = pd.read_csv(gazetteer_path, sep='\t', header=None, quoting=3, dtype=str, keep_default_na=False,
+                         usecols=sorted(positions.values()))
+        lats = pd.to_numeric(df[positions['lat']], errors='coerce').values
+        lngs = pd.to_numeric(df[positions['lng']], errors='coerce').values
+        valid = np.isfinite(lats) & np.isfinite(lngs)
+        if 'feature_class' in positions:
+            valid &= (df[positions['feature_class']] == POPULATED_PLACE_CLASS).values
+
+        index = cls({}, cell_size)
+        keys = index._cell_keys(lats[valid], lngs[valid])
+        order = np.argsort(keys, kind='mergesort')
+        index.arrays = {'keys': keys[order], 'lat': lats[valid][order], 'lng': lngs[valid][order]}
+        for feature in FEATURES:
+            if feature in positions:
+                # Fixed width unicode arrays, unlike object arrays, can be memory-mapped
+                index.arrays[feature] = np.asarray(df[positions[feature]], dtype=str)[valid][order]
+        logger.info("Indexed {} places of gazetteer {}".format(len(order), gazetteer_path))
+        return index
+
+    def save(self, index_dir):
+        """
+        Write the index to `index_dir`, atomically so that concurrent recipes never load a partial index
+        """
+        save_arrays(index_dir, self.arrays, {'version': INDEX_VERSION, 'cell_size': self.cell_size})
+
+    @classmethod
+    def load(cls, index_dir):
+        arrays, meta = load_arrays(index_dir)
+        return cls(arrays, meta['cell_size'])
+
+    @classmethod
+    def load_or_build(cls, gazetteer_path, index_dir=None):
+        """
+        Load the index of a gazetteer, building it the first time or when the gazetteer changed
+        """
+        if index_dir is None:
+            stat = os.stat(gazetteer_path)
+            signature = '{}|{}|{}|{}'.format(os.path.abspath(gazetteer_path), stat.st_size, stat.st_mtime, INDEX_VERSION)
+            index_dir = get_index_dir(hashlib.sha1(signature.encode('utf-8')).hexdigest())
+
+        if not is_saved(index_dir):
+            cls.build(gazetteer_path).save(index_dir)
+        logger.info("Loading gazetteer index from {}".format(index_dir))
+        return cls.load(index_dir)
+
+    def nearest(self, lats, lngs):
+        """
+        Find the nearest place of each location, among the places of its grid cell and of the neighbouring ones
+
+        :param lats: array of latitudes
+        :param lngs: array of longitudes
+        :return: array of the position of the nearest place of each location, -1 if there is none nearby
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        nearest = np.full(len(lats), -1, dtype=np.int64)
+        queries = np.flatnonzero(np.isfinite(lats) & np.isfinite(lngs))
+        if len(queries) == 0 or len(self.arrays['keys']) == 0:
+            return nearest
+
+        # Range of the candidate places of each location in each of the 9 cells around it
+        starts, counts = [], []
+        for lat_offset in (-1, 0, 1):
+            for lng_offset in (-1, 0, 1):
+                keys = self._cell_keys(lats[queries], lngs[queries], lat_offset, lng_offset)
+                cell_starts = np.searchsorted(self.arrays['keys'], keys, side='left')
+                starts.append(cell_starts)
+                counts.append(np.searchsorted(self.arrays['keys'], keys, side='right') - cell_starts)
+        starts, counts = np.array(starts), np.array(counts)
+
+        # Locations are looked up by groups of at most `max_candidates` pairs of (location, candidate place), a
+        # location of a denser area than that being looked up alone
+        cumulated = np.cumsum(counts.sum(axis=0))
+        begin = 0
+        while begin < len(queries):
+            done = cumulated[begin - 1] if begin else 0
+            end = max(int(np.searchsorted(cumulated, done + self.max_candidates, side='right')), begin + 1)
+            group = slice(begin, end)
+            self._nearest_candidates(lats, lngs, queries[group], starts[:, group], counts[:, group], nearest)
+            begin = end
+        return nearest
+
+    def _nearest_candidates(self, lats, lngs, queries, starts, counts, nearest):
+        """
+        Set in `nearest` the nearest place of each location of `queries` among its candidate places, given by their
+        `starts` and `counts` in each cell
+        """
+        starts, counts = starts.ravel(), counts.ravel()
+        candidate_queries = np.repeat(np.tile(queries, len(counts) // len(queries)), counts)
+        if len(candidate_queries) == 0:
+            return
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidate_places = np.repeat(starts, counts) + offsets
+
+        distances = haversine_distances(lats[candidate_queries], lngs[candidate_queries],
+                                        self.arrays['lat'][candidate_places], self.arrays['lng'][candidate_places])
+        # Closest candidate of each location comes first once sorted by location then distance
+        order = np.lexsort((distances, candidate_queries))
+        sorted_queries = candidate_queries[order]
+        first = order[np.concatenate([[True], sorted_queries[1:] != sorted_queries[:-1]])]
+        nearest[candidate_queries[first]] = candidate_places[first]
+
+    def reverse_geocode(self, locations):
+        """
+        Batch reverse geocoding function of the offline provider
+
+        :param locations: list of (lat, lng) locations
+        :return: list of OfflineResult
+        """
+        locations = np.array(locations, dtype=float).reshape(-1, 2)
+        nearest = self.nearest(locations[:, 0], locations[:, 1])
+        found = nearest >= 0
+
+        values = {}
+        for feature in FEATURES:
+            values[feature] = np.full(len(nearest), None, dtype=object)
+            if feature in self.arrays:
+                values[feature][found] = self.arrays[feature][nearest[found]]
+        return [OfflineResult(None, *row) for row in zip(*[values[feature] for feature in FEATURES])]
+
+
+def haversine_distances(lats1, lngs1, lats2, lngs2):
+    """
+    Vectorized great circle distances in meters
+    """
+    lats1, lngs1, lats2, lngs2 = [np.radians(v) for v in (lats1, lngs1, lats2, lngs2)]
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lngs2 - lngs1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(1., np.sqrt(a)))
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+END = object()
+
+
+def parallel_map(function, items, workers=1):
+    """
+    Apply `function` to every element of `items` using up to `workers` threads
+
+    Results are returned in the same order as `items`, whatever the order in which the calls complete
+    :param function: function taking a single element of `items`
+    :param items: list of elements to process
+    :param workers: maximum number of concurrent calls, 1 or less means sequential
+    :return: list of results
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(function, items))
+
+
+def prefetch(iterable, size=1):
+    """
+    Iterate over `iterable` from a background thread, at most `size` elements being produced ahead of the consumer
+
+    Exceptions raised by `iterable` are raised again to the consumer
+    :param iterable:
+    :param size: maximum number of elements waiting to be consumed
+    :return: generator of the elements of `iterable`
+    """
+    items = queue.Queue(maxsize=size)
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+            items.put((END, None))
+        except Exception as e:
+            items.put((None, e))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is END:
+            return
+        yield item
+
+
+class BackgroundWriter(object):
+    """
+    Write dataframes with a dataset `writer` from a background thread, at most `size` dataframes waiting to be written
+
+    An exception raised while writing is raised again by the next call to `write_dataframe` or `close`
+    """
+
+    def __init__(self, writer, size=1):
+        self.writer = writer
+        self._dataframes = queue.Queue(maxsize=size)
+        self._error = None
+        self._thread = threading.Thread(target=self._consume)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _consume(self):
+        while True:
+            df = self._dataframes.get()
+            if df is END:
+                return
+            if self._error is None:
+                try:
+                    self.writer.write_dataframe(df)
+                except Exception as e:
+                    self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write_dataframe(self, df):
+        self._raise_error()
+        self._dataframes.put(df)
+
+    def close(self):
+        self._dataframes.put(END)
+        self._thread.join()
+        self.writer.close()
+        self._raise_error()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from email.utils import parsedate_tz, mktime_tz
+
+from geocoder_constants import THROTTLING_STATUS_CODES
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+
+class RateLimiter(object):
+    """
+    Thread safe token bucket pacing the queries sent to a geocoding provider
+
+    The rate is halved each time the provider throttles a query and slowly recovers up to `rate` as
+    queries succeed again. Without `rate`, queries are not paced but throttling is still honoured.
+    """
+
+    def __init__(self, rate=None, burst=1, max_retries=5, backoff=1.0):
+        self.max_rate = float(rate) if rate else None
+        self.rate = self.max_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a query can be sent to the provider
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                    self._last_refill = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, delay):
+        """
+        Pause all queries for `delay` seconds and halve the current rate
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            if self.rate is not None:
+                self.rate = max(self.max_rate / 64, self.rate / 2)
+                self._tokens = 0.
+
+    def release(self):
+        """
+        Record a query that was not throttled, letting the rate recover towards its maximum
+        """
+        if self.rate is not None and self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def wrap(self, function):
+        """
+        Return `function` paced by the limiter, queries throttled by the provider being retried with backoff
+        """
+        def rate_limited_function(*args, **kwargs):
+            for attempt in range(self.max_retries + 1):
+                self.acquire()
+                out = function(*args, **kwargs)
+                if getattr(out, 'status_code', None) not in THROTTLING_STATUS_CODES:
+                    self.release()
+                    return out
+
+                delay = get_retry_after(out)
+                if delay is None:
+                    delay = self.backoff * 2 ** attempt
+                logger.warning("Throttled by the provider (status code {}), retrying in {:.1f}s".format(out.status_code, delay))
+                self.throttle(delay)
+            return out
+
+        return rate_limited_function
+
+
+def get_retry_after(out):
+    """
+    Read the delay requested by the provider in the Retry-After header of the response, if any
+
+    :param out: geocoder result
+    :return: delay in seconds or None
+    """
+    response = getattr(out, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After')
+    if not retry_after:
+        return None
+
+    try:
+        return max(0., float(retry_after))
+    except ValueError:
+        date = parsedate_tz(retry_after)
+        if date is None:
+            return None
+        return max(0., mktime_tz(date) - time.time())
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+STAGES = ['read', 'cache', 'provider', 'write']
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+class TimedCache(object):
+    """
+    Cache wrapper adding the time spent in its bulk reads and writes to the 'cache' stage of `metrics`
+    """
+
+    def __init__(self, cache, metrics):
+        self.cache = cache
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def get_many(self, keys):
+        with self.metrics.timer('cache'):
+            return self.cache.get_many(keys)
+
+    def set_many(self, items):
+        with self.metrics.timer('cache'):
+            return self.cache.set_many(items)
+
+    def get_no_matches(self, keys):
+        with self.metrics.timer('cache'):
+            return self.cache.get_no_matches(keys)
+
+    def set_no_matches(self, keys, ttl):
+        with self.metrics.timer('cache'):
+            return self.cache.set_no_matches(keys, ttl)
+
+
+class RecipeMetrics(object):
+    """
+    Timing and counters of a geocoding recipe run, per chunk and in total
+
+    Each chunk records the wall time spent in each stage:
+    - read: waiting for the chunk to be read from the input dataset
+    - cache: bulk cache lookups and writes
+    - provider: time during which at least one query to the geocoding provider is in flight
+    - write: waiting for the output dataset to accept the chunk
+    Its wall time and rows per second cover its geocoding only, since reading and writing chunks overlap with the
+    geocoding of other chunks.
+
+    Every provider call is timed, whether it queries a single address or location or a whole batch, and the
+    exceptions it raises and HTTP error status codes it returns are counted by type.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.latencies = []
+        self.errors = collections.Counter()
+        self._chunk = None
+        self._hit_counts = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._busy_since = None
+        self._start = time.time()
+
+    def start_chunk(self, hit_counts=None):
+        """
+        :param hit_counts: cache hit counts at the start of the chunk, by tier
+        """
+        self._chunk = dict([(stage, 0.) for stage in STAGES])
+        self._chunk['start'] = time.time()
+        self._hit_counts = dict(hit_counts or {})
+
+    def end_chunk(self, rows, not_geocoded=0, hit_counts=None, skipped=0):
+        """
+        :param rows: number of rows of the chunk geocoded
+        :param not_geocoded: number of rows left without geocoding result
+        :param hit_counts: cache hit counts at the end of the chunk, by tier
+        :param skipped: number of rows of the chunk skipped as already geocoded in a previous run
+        """
+        chunk = self._chunk
+        chunk['chunk'] = len(self.chunks)
+        chunk['rows'] = rows
+        chunk['skipped'] = skipped
+        chunk['not_geocoded'] = not_geocoded
+        deltas = dict([(tier, count - self._hit_counts.get(tier, 0)) for tier, count in (hit_counts or {}).items()])
+        chunk['hit_counts'] = dict(deltas)
+        chunk['cache_misses'] = deltas.pop('miss', 0)
+        chunk['cache_hits'] = sum(deltas.values())
+        chunk['wall'] = time.time() - chunk.pop('start')
+        chunk['rows_per_second'] = rows / chunk['wall'] if chunk['wall'] > 0 else None
+        self.chunks.append(chunk)
+        self._chunk = None
+
+    def drain(self):
+        """
+        Take the chunks, provider latencies and errors recorded so far, to be merged into the metrics of another process
+        :return: tuple of the list of chunks, the list of latencies and the dict of error counts
+        """
+        with self._lock:
+            drained = self.chunks, self.latencies, dict(self.errors)
+            self.chunks, self.latencies, self.errors = [], [], collections.Counter()
+        return drained
+
+    def add_chunk(self, chunk, latencies=None, errors=None):
+        """
+        Add a chunk geocoded by a chunk geocoder, possibly in a worker process
+        :param chunk: metrics of the chunk, as recorded by `end_chunk`
+        :param latencies: latencies of the provider calls of the chunk
+        :param errors: error counts of the chunk, by type
+        """
+        chunk = dict(chunk, chunk=len(self.chunks))
+        with self._lock:
+            self.chunks.append(chunk)
+            self.latencies.extend(latencies or [])
+            self.errors.update(errors or {})
+        logger.info("Chunk {chunk}: {rows} rows in {wall:.2f}s (read {read:.2f}s, cache {cache:.2f}s, provider "
+                    "{provider:.2f}s, write {write:.2f}s)".format(**chunk))
+
+    def add_time(self, stage, duration):
+        with self._lock:
+            if self._chunk is not None:
+                self._chunk[stage] += duration
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.time() - start)
+
+    def wrap(self, function):
+        """
+        Time each call of the geocoding function `function`, and count its errors
+        """
+        def timed_function(*args, **kwargs):
+            with self._lock:
+                self._in_flight += 1
+                if self._in_flight == 1:
+                    self._busy_since = time.time()
+            start = time.time()
+            try:
+                out = function(*args, **kwargs)
+            except Exception as e:
+                self.record_error(type(e).__name__)
+                raise
+            finally:
+                end = time.time()
+                with self._lock:
+                    self.latencies.append(end - start)
+                    self._in_flight -= 1
+                    if self._in_flight == 0 and self._chunk is not None:
+                        self._chunk['provider'] += end - self._busy_since
+            status_code = getattr(out, 'status_code', None)
+            if isinstance(status_code, int) and status_code >= 400:
+                self.record_error('HTTP {}'.format(status_code))
+            return out
+        return timed_function
+
+    def record_error(self, error_type):
+        with self._lock:
+            self.errors[error_type] += 1
+
+    def summary(self):
+        """
+        Structured summary of the run
+        :return: dict
+        """
+        hit_counts = collections.Counter()
+        for chunk in self.chunks:
+            hit_counts.update(chunk.get('hit_counts', {}))
+        rows = sum([chunk['rows'] for chunk in self.chunks])
+        wall = time.time() - self._start
+        summary = {
+            'chunks': len(self.chunks),
+            'rows': rows,
+            'skipped': sum([chunk['skipped'] for chunk in self.chunks]),
+            'not_geocoded': sum([chunk['not_geocoded'] for chunk in self.chunks]),
+            'wall_seconds': wall,
+            'rows_per_second': rows / wall if wall > 0 else None,
+            'stage_seconds': dict([(stage, sum([chunk[stage] for chunk in self.chunks])) for stage in STAGES]),
+            'provider_calls': len(self.latencies),
+            'provider_latency_seconds': {},
+            'errors': dict(self.errors),
+            'cache_hits': dict(hit_counts)
+        }
+        if self.latencies:
+            values = np.percentile(self.latencies, LATENCY_PERCENTILES)
+            summary['provider_latency_seconds'] = dict([('p{}'.format(p), v) for p, v in zip(LATENCY_PERCENTILES, values)])
+            summary['provider_latency_seconds']['max'] = max(self.latencies)
+        return summary
+
+    def to_dataframe(self):
+        """
+        Metrics of each chunk, to be written to a metrics dataset
+        """
+        columns = ['chunk', 'rows', 'skipped', 'not_geocoded', 'cache_hits', 'cache_misses', 'wall'] + STAGES + ['rows_per_second']
+        return pd.DataFrame(self.chunks, columns=columns)
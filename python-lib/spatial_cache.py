@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import numbers
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def is_location(key):
+    """
+    Tell whether a cache key is a (lat, lng) location, the forward geocoding keys being addresses
+    """
+    return isinstance(key, tuple) and len(key) == 2 and \
+        all([isinstance(v, numbers.Real) and not math.isnan(v) for v in key])
+
+
+def haversine_distance(location, other):
+    """
+    Great circle distance in meters between two (lat, lng) locations
+    """
+    lat1, lng1, lat2, lng2 = [math.radians(v) for v in (location[0], location[1], other[0], other[1])]
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1., math.sqrt(a)))
+
+
+class GridIndex(object):
+    """
+    Spatial index of (lat, lng) locations in square grid cells of `tolerance` meters of latitude
+    """
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.step = tolerance / METERS_PER_DEGREE
+        self.lng_cells = int(math.ceil(360. / self.step))
+        self._cells = {}
+
+    def _cell(self, location):
+        # Longitude cells wrap around the antimeridian
+        i = int(math.floor(location[0] / self.step))
+        return i, int(math.floor((location[1] + 180.) / self.step)) % self.lng_cells
+
+    def add(self, location):
+        self._cells.setdefault(self._cell(location), []).append(location)
+
+    def nearest(self, location):
+        """
+        Find the indexed location closest to `location`, if any within `tolerance` meters
+        :return: (lat, lng) tuple or None
+        """
+        i, j = self._cell(location)
+        # A degree of longitude gets shorter towards the poles, more cells are then within reach
+        lng_cells = int(math.ceil(1. / max(math.cos(math.radians(location[0])), 1e-3)))
+
+        columns = set([(j + dj) % self.lng_cells for dj in range(-lng_cells, lng_cells + 1)])
+
+        nearest, nearest_distance = None, self.tolerance
+        for di in range(-1, 2):
+            for column in columns:
+                for candidate in self._cells.get((i + di, column), []):
+                    distance = haversine_distance(location, candidate)
+                    if distance <= nearest_distance:
+                        nearest, nearest_distance = candidate, distance
+        return nearest
+
+    def __len__(self):
+        return sum([len(locations) for locations in self._cells.values()])
+
+
+class SpatialCache(object):
+    """
+    Reverse geocoding cache also answering for locations within `tolerance` meters of a cached location
+
+    The underlying cache keeps its exact (lat, lng) keys, so that it stays valid whatever the tolerance. The grid
+    index is built from the keys already in the cache and updated with every new result.
+    """
+
+    def __init__(self, cache, tolerance):
+        self.cache = cache
+        self.index = GridIndex(tolerance)
+        for key in cache.iterkeys():
+            if is_location(key):
+                self.index.add(key)
+        self.hit_counts = cache.hit_counts
+        self.hit_counts.setdefault('nearby', 0)
+        logger.info("Indexed {} cached locations with a tolerance of {} meters".format(len(self.index), tolerance))
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def get_many(self, locations):
+        """
+        Retrieve the values of several locations, falling back on the closest cached location within tolerance
+        :param locations: iterable of (lat, lng) tuples
+        :return: dict of the values of the locations found in the cache
+        """
+        results = self.cache.get_many(locations)
+
+        nearby = {}
+        for location in locations:
+            if location not in results and is_location(location):
+                neighbour = self.index.nearest(location)
+                if neighbour is not None:
+                    nearby[location] = neighbour
+
+        if nearby:
+            values = self.cache.get_many(set(nearby.values()))
+            for location, neighbour in nearby.items():
+                if neighbour in values:
+                    results[location] = values[neighbour]
+                    self.hit_counts['miss'] -= 1
+                    self.hit_counts['nearby'] += 1
+        return results
+
+    def set_many(self, items):
+        """
+        Store several values and index their locations
+        :param items: dict or iterable of ((lat, lng), value) pairs
+        """
+        items = list(items.items() if isinstance(items, dict) else items)
+        self.cache.set_many(items)
+        for location, _ in items:
+            if is_location(location):
+                self.index.add(location)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from parallel_utils import parallel_map
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format='Plugin: Geocoder | %(levelname)s - %(message)s')
+
+
+class FailedResult(object):
+    """
+    Result of a query of a virtual batch which raised an exception, neither located nor a permanent absence of match
+    """
+
+    def __init__(self, error):
+        self.error = error
+        self.status_code = getattr(error, 'status_code', None)
+        self.latlng = None
+        self.lat = None
+        self.lng = None
+        self.address = None
+        self.city = None
+        self.postal = None
+        self.state = None
+        self.country = None
+
+
+class VirtualBatch(object):
+    """
+    Batch geocoding function of a provider without batch endpoint, answering a list of queries with concurrent single
+    queries to `single_function`, up to `workers` in flight
+
+    It exposes the interface of the batch endpoints, `fun(list)` returning a result per query, so that every
+    provider goes through the batch code path. A query which fails does not fail the batch, its result is a
+    FailedResult.
+    """
+
+    def __init__(self, single_function, workers=1, unpack=False):
+        """
+        :param single_function: geocoding function of a single query
+        :param workers: maximum number of concurrent queries
+        :param unpack: whether queries are tuples of arguments of `single_function`, such as (lat, lng) locations
+        """
+        self.single_function = single_function
+        self.workers = workers
+        self.unpack = unpack
+
+    def _call(self, query):
+        try:
+            return self.single_function(*query) if self.unpack else self.single_function(query)
+        except Exception as e:
+            return FailedResult(e)
+
+    def __call__(self, queries):
+        """
+        :param queries: list of addresses, or of (lat, lng) locations
+        :return: list of the result of each query, in the order of `queries`
+        """
+        return parallel_map(self._call, queries, self.workers)
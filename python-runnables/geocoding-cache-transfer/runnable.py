@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import dataiku
+import pandas as pd
+
+from dataiku.runnables import Runnable
+from cache_backends import get_cache_handler
+from cache_transfer import CACHE_COLUMNS, export_cache, import_cache
+from dku_io import get_cache_location
+
+
+class CacheTransferRunnable(Runnable):
+    """
+    Export the geocoding cache of the current user, or import an export into it
+    """
+
+    def __init__(self, project_key, config, plugin_config):
+        self.project_key = project_key
+        self.config = config
+        self.plugin_config = plugin_config
+
+    def get_progress_target(self):
+        return None
+
+    def run(self, progress_callback):
+        forward = self.config.get('cache', 'forward') == 'forward'
+        action = self.config.get('action', 'export')
+        target = self.config.get('target', 'dataset')
+        if action == 'migrate':
+            return self.migrate_cache(forward)
+        if target == 'dataset' and not self.config.get('dataset'):
+            raise AttributeError('Please select a dataset.')
+        if target == 'parquet' and not self.config.get('parquet_path'):
+            raise AttributeError('Please enter the path of the Parquet file.')
+
+        prefix = 'forward' if forward else 'reverse'
+        with self.open_cache(forward) as cache:
+            if action == 'export':
+                count = self.export_cache(cache, forward, target)
+                return 'Exported {} entries of the {} geocoding cache'.format(count, prefix)
+            count = import_cache(cache, self.read_export(target))
+            return 'Imported {} entries into the {} geocoding cache'.format(count, prefix)
+
+    def open_cache(self, forward):
+        prefix = 'forward' if forward else 'reverse'
+        _, cache_location = get_cache_location(self.plugin_config, forward)
+        cache_config = {
+            'cache_backend': self.plugin_config.get('cache_backend', 'disk'),
+            'redis_url': self.plugin_config.get('redis_url'),
+            'cache_location': cache_location,
+            'cache_enabled': True,
+            'cache_size': self.plugin_config.get(prefix + '_cache_size', 1000) * 1000,
+            'cache_eviction': self.plugin_config.get(prefix + '_cache_policy', 'least-recently-stored'),
+            'cache_memory_size': 0
+        }
+        return get_cache_handler(cache_config, forward)
+
+    def migrate_cache(self, forward):
+        prefix = 'forward' if forward else 'reverse'
+        with self.open_cache(forward) as cache:
+            if not hasattr(cache, 'migrate_values'):
+                return 'Only the local disk cache stores values to migrate'
+            count = cache.migrate_values()
+        return 'Migrated {} entries of the {} geocoding cache to the compact encoding'.format(count, prefix)
+
+    def export_cache(self, cache, forward, target):
+        chunks = export_cache(cache, forward)
+        if target == 'parquet':
+            df = pd.concat(list(chunks) or [pd.DataFrame(columns=CACHE_COLUMNS)], ignore_index=True)
+            df.to_parquet(self.config['parquet_path'], index=False)
+            return len(df)
+
+        dataset = dataiku.Dataset(self.config['dataset'], project_key=self.project_key)
+        dataset.write_schema([{'name': 'key', 'type': 'string'}, {'name': 'value', 'type': 'string'},
+                              {'name': 'no_match', 'type': 'boolean'}, {'name': 'expire_time', 'type': 'double'}])
+        count = 0
+        with dataset.get_writer() as writer:
+            for df in chunks:
+                writer.write_dataframe(df)
+                count += len(df)
+        return count
+
+    def read_export(self, target):
+        if target == 'parquet':
+            return [pd.read_parquet(self.config['parquet_path'])]
+        dataset = dataiku.Dataset(self.config['dataset'], project_key=self.project_key)
+        return dataset.iter_dataframes(columns=CACHE_COLUMNS, chunksize=10000)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the forward and reverse geocoding of dataframes against a simulated provider, without network
+
+    make benchmark BENCHMARK_ARGS="--rows 50000 --latency 0.001 --output results.csv"
+
+Every combination of direction, chunk size, duplicate ratio, cache state and batch mode is run on the same number of
+rows, and its rows per second and peak memory are reported. With --baseline, the run fails when a scenario is slower
+than in a previous --output by more than --tolerance.
+"""
+
+import argparse
+import itertools
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from cache_handler import CacheHandler
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from simulated_provider import SimulatedProvider
+
+SCENARIO_COLUMNS = ['direction', 'chunk_size', 'duplicate_ratio', 'cache', 'batch']
+
+
+def generate_dataframe(direction, rows, duplicate_ratio, seed=0):
+    """
+    Input dataframe of `rows` rows, of which a ratio `duplicate_ratio` repeat the address or location of another row
+    """
+    rng = np.random.RandomState(seed)
+    distinct = max(1, int(round(rows * (1 - duplicate_ratio))))
+    keys = np.concatenate([np.arange(distinct), rng.randint(0, distinct, rows - distinct)])
+    rng.shuffle(keys)
+    if direction == 'forward':
+        return pd.DataFrame({'id': np.arange(rows), 'address': ['{} simulated street'.format(key) for key in keys]})
+    lats = rng.uniform(-80, 80, distinct)
+    lngs = rng.uniform(-180, 180, distinct)
+    return pd.DataFrame({'id': np.arange(rows), 'lat': lats[keys], 'lng': lngs[keys]})
+
+
+def get_config(direction, batch, batch_size, workers):
+    config = {'batch_enabled': batch, 'batch_size': batch_size, 'workers': workers}
+    if direction == 'forward':
+        config.update({'address_column': 'address', 'latitude': 'latitude', 'longitude': 'longitude',
+                       'address_normalization': 'full'})
+    else:
+        config.update({'lat_column': 'lat', 'lng_column': 'lng',
+                       'features': [{'name': f, 'column': f} for f in ['address', 'city', 'postal', 'state', 'country']]})
+    return config
+
+
+def geocode_dataframe(df, direction, config, provider, cache, chunk_size):
+    """
+    Geocode `df` chunk by chunk, as the recipe does
+    """
+    if direction == 'forward':
+        fun = provider.forward_batch if config['batch_enabled'] else provider.forward
+        add_columns = add_forward_geocode_columns
+    else:
+        fun = provider.reverse_batch if config['batch_enabled'] else provider.reverse
+        add_columns = add_reverse_geocode_columns
+    for start in range(0, len(df), chunk_size):
+        add_columns(cache, config, df.iloc[start:start + chunk_size].copy(), fun)
+
+
+def run_scenario(args, direction, chunk_size, duplicate_ratio, cache_state, batch):
+    df = generate_dataframe(direction, args.rows, duplicate_ratio)
+    config = get_config(direction, batch, args.batch_size, args.workers)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        if cache_state == 'warm':
+            with CacheHandler(cache_dir) as cache:
+                geocode_dataframe(df, direction, config, SimulatedProvider(), cache, chunk_size)
+
+        measures = {}
+        for pass_name in ['time', 'memory']:
+            # Each pass starts from the same disk cache, with an empty memory tier
+            pass_dir = tempfile.mkdtemp()
+            shutil.rmtree(pass_dir)
+            shutil.copytree(cache_dir, pass_dir)
+            provider = SimulatedProvider(args.latency, args.item_latency, args.error_rate)
+            try:
+                with CacheHandler(pass_dir, memory_size=args.memory_cache_size) as cache:
+                    if pass_name == 'memory':
+                        tracemalloc.start()
+                    start = time.time()
+                    geocode_dataframe(df, direction, config, provider, cache, chunk_size)
+                    measures[pass_name] = time.time() - start
+                    if pass_name == 'memory':
+                        measures['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+                        tracemalloc.stop()
+            finally:
+                shutil.rmtree(pass_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {'rows_per_second': args.rows / measures['time'], 'seconds': measures['time'],
+            'peak_memory_mb': measures['peak_memory_mb'], 'provider_calls': provider.calls}
+
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    """
+    :return: scenarios slower than in the baseline by more than `tolerance`
+    """
+    baseline = pd.read_csv(baseline_path)
+    comparison = results.merge(baseline[SCENARIO_COLUMNS + ['rows_per_second']], on=SCENARIO_COLUMNS,
+                               suffixes=('', '_baseline'))
+    comparison['ratio'] = comparison['rows_per_second'] / comparison['rows_per_second_baseline']
+    return comparison[comparison['ratio'] < 1 - tolerance]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of dataframe geocoding against a simulated provider')
+    parser.add_argument('--rows', type=int, default=20000, help='Number of rows of each scenario')
+    parser.add_argument('--directions', nargs='+', default=['forward', 'reverse'])
+    parser.add_argument('--chunk-sizes', nargs='+', type=int, default=[1000, 10000])
+    parser.add_argument('--duplicate-ratios', nargs='+', type=float, default=[0., 0.5, 0.9])
+    parser.add_argument('--cache-states', nargs='+', default=['cold', 'warm'])
+    parser.add_argument('--batch-modes', nargs='+', default=['off', 'on'])
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1, help='Concurrent queries without batch')
+    parser.add_argument('--latency', type=float, default=0., help='Seconds per provider query')
+    parser.add_argument('--item-latency', type=float, default=0., help='Additional seconds per item of a batch query')
+    parser.add_argument('--error-rate', type=float, default=0., help='Probability of a query or batch item to fail')
+    parser.add_argument('--memory-cache-size', type=int, default=100000)
+    parser.add_argument('--output', help='CSV file to write the results to')
+    parser.add_argument('--baseline', help='CSV file of previous results to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Accepted slowdown compared to the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for scenario in itertools.product(args.directions, args.chunk_sizes, args.duplicate_ratios, args.cache_states,
+                                      args.batch_modes):
+        direction, chunk_size, duplicate_ratio, cache_state, batch_mode = scenario
+        measures = run_scenario(args, direction, chunk_size, duplicate_ratio, cache_state, batch_mode == 'on')
+        results.append(dict(zip(SCENARIO_COLUMNS, scenario), **measures))
+        print('{} {:>8.0f} rows/s {:>8.1f} MB'.format(scenario, measures['rows_per_second'], measures['peak_memory_mb']))
+        sys.stdout.flush()
+
+    results = pd.DataFrame(results, columns=SCENARIO_COLUMNS + ['rows_per_second', 'seconds', 'peak_memory_mb',
+                                                                'provider_calls'])
+    print(results.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        if len(regressions):
+            print('Slower than the baseline:\n{}'.format(regressions.to_string(index=False)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+
+
+class SimulatedResult(object):
+    """
+    Geocoding result exposing the attributes read from the results of the geocoder library
+    """
+
+    def __init__(self, latlng=None, address=None, city=None, postal=None, state=None, country=None, status_code=200):
+        self.latlng = latlng
+        self.address = address
+        self.city = city
+        self.postal = postal
+        self.state = state
+        self.country = country
+        self.status_code = status_code
+
+    @property
+    def lat(self):
+        return self.latlng[0] if self.latlng else None
+
+    @property
+    def lng(self):
+        return self.latlng[1] if self.latlng else None
+
+
+class SimulatedProvider(object):
+    """
+    Geocoding provider answering without network, with a configurable latency and error rate
+
+    - single queries take `latency` seconds and raise an exception with a probability of `error_rate`
+    - batch queries take `latency` seconds plus `item_latency` seconds per item, each item of the batch being left
+    without result with a probability of `error_rate`
+
+    Addresses are located from their leading number, locations are in the city named after their integer latitude.
+    """
+
+    def __init__(self, latency=0., item_latency=0., error_rate=0., seed=0):
+        self.latency = latency
+        self.item_latency = item_latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _query(self, items=1):
+        with self._lock:
+            self.calls += 1
+            failures = [self._random.random() < self.error_rate for _ in range(items)]
+        time.sleep(self.latency + self.item_latency * items)
+        return failures
+
+    @staticmethod
+    def _locate(address):
+        number = float(str(address).split(' ')[0])
+        return [number % 90, -(number % 180)]
+
+    @staticmethod
+    def _describe(lat, lng):
+        return SimulatedResult(address='{} {}'.format(lat, lng), city='city {}'.format(int(lat)), country='country')
+
+    def forward(self, address):
+        if self._query()[0]:
+            raise IOError('Simulated provider error')
+        return SimulatedResult(latlng=self._locate(address))
+
+    def forward_batch(self, addresses):
+        failures = self._query(len(addresses))
+        return [SimulatedResult() if failed else SimulatedResult(latlng=self._locate(address))
+                for address, failed in zip(addresses, failures)]
+
+    def reverse(self, lat, lng):
+        if self._query()[0]:
+            raise IOError('Simulated provider error')
+        return self._describe(lat, lng)
+
+    def reverse_batch(self, locations):
+        failures = self._query(len(locations))
+        return [SimulatedResult() if failed else self._describe(lat, lng)
+                for (lat, lng), failed in zip(locations, failures)]
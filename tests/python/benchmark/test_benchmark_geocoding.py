@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pandas as pd
+
+from benchmark_geocoding import main
+
+
+def test_benchmark_runs_every_scenario(tmp_path):
+    output = os.path.join(str(tmp_path), 'results.csv')
+    assert main(['--rows', '200', '--chunk-sizes', '50', '--duplicate-ratios', '0', '0.5', '--error-rate', '0.1',
+                 '--output', output]) == 0
+
+    results = pd.read_csv(output)
+    assert len(results) == 2 * 2 * 2 * 2
+    assert (results['rows_per_second'] > 0).all() and (results['peak_memory_mb'] > 0).all()
+    # Warm cache and duplicates save provider calls
+    calls = results.set_index(['direction', 'duplicate_ratio', 'cache', 'batch'])['provider_calls']
+    assert (calls.xs('warm', level='cache') == 0).all()
+    cold = calls.xs(('cold', 'off'), level=['cache', 'batch'])
+    assert (cold.xs(0.5, level='duplicate_ratio') < cold.xs(0., level='duplicate_ratio')).all()
+
+    # A scenario twice as fast in the baseline is a regression
+    baseline = os.path.join(str(tmp_path), 'baseline.csv')
+    results.assign(rows_per_second=results['rows_per_second'] * 2).to_csv(baseline, index=False)
+    assert main(['--rows', '200', '--chunk-sizes', '50', '--duplicate-ratios', '0', '--directions', 'forward',
+                 '--cache-states', 'cold', '--baseline', baseline]) == 1
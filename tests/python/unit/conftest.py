@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from cache_utils import CustomTmpFile
+
+
+@pytest.fixture
+def cache_dir():
+    tmp_cache = CustomTmpFile()
+    yield tmp_cache.get_temporary_cache_dir().name
+    tmp_cache.clean()
+
+
+def get_forward_config(**kwargs):
+    """
+    Forward geocoding configuration of the dataframe functions, without batch unless overridden by `kwargs`
+    """
+    config = {'address_column': 'address', 'latitude': 'geo_latitude', 'longitude': 'geo_longitude',
+              'batch_enabled': False, 'batch_size': 0}
+    config.update(kwargs)
+    return config
+
+
+def get_reverse_config(**kwargs):
+    """
+    Reverse geocoding configuration of the dataframe functions, without batch unless overridden by `kwargs`
+    """
+    config = {'lat_column': 'latitude', 'lng_column': 'longitude', 'batch_enabled': False, 'batch_size': 50,
+              'features': [{'name': 'city', 'column': 'geo_city'}, {'name': 'country', 'column': 'geo_country'}]}
+    config.update(kwargs)
+    return config
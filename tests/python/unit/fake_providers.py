@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import abc
+import threading
+import time
+
+
+class FakeResult(object):
+
+    def __init__(self, latlng=None, address=None, city=None, postal=None, state=None, country=None, status_code=200,
+                 error=False):
+        self.latlng = latlng
+        self.address = address
+        self.city = city
+        self.postal = postal
+        self.state = state
+        self.country = country
+        self.status_code = status_code
+        self.error = error
+
+    @property
+    def lat(self):
+        return self.latlng[0] if self.latlng else None
+
+    @property
+    def lng(self):
+        return self.latlng[1] if self.latlng else None
+
+
+class FakeProvider(abc.ABC):
+    """
+    Offline geocoding function recording the queries it receives and how many are in flight at the same time, its
+    subclasses implementing the answer to a query
+    """
+
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def calls(self):
+        return len(self.queries)
+
+    def __call__(self, *query):
+        with self._lock:
+            self.queries.append(query)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return self.answer(*query)
+
+    @abc.abstractmethod
+    def answer(self, *query):
+        pass
+
+
+class FakeForwardProvider(FakeProvider):
+    """
+    Addresses starting with a number N are located at (N, -N), the other ones are unknown
+    """
+
+    def answer(self, address):
+        try:
+            number = float(str(address).split(' ')[0])
+        except ValueError:
+            return FakeResult()
+        return FakeResult(latlng=[number, -number])
+
+
+class FakeReverseProvider(FakeProvider):
+    """
+    Locations are in the city named after their integer latitude
+    """
+
+    def answer(self, lat, lng):
+        return FakeResult(address='{} {}'.format(lat, lng), city='city {}'.format(int(lat)), country='country')
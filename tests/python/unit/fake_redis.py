@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import time
+
+
+class FakeRedis(object):
+    """
+    In-process stand-in of a Redis client, for the commands used by the Redis cache backend
+
+    Values are stored as bytes, as returned by a server, and `round_trips` counts the requests sent to it.
+    """
+
+    def __init__(self):
+        self.round_trips = 0
+        self._values = {}
+        self._expires = {}
+
+    def _live(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.time():
+            self._values.pop(name, None)
+            self._expires.pop(name, None)
+        return name in self._values
+
+    def _set(self, name, value, ex=None):
+        self._values[name] = value.encode('utf-8') if isinstance(value, str) else value
+        self._expires[name] = time.time() + ex if ex else None
+
+    def get(self, name):
+        self.round_trips += 1
+        return self._values[name] if self._live(name) else None
+
+    def set(self, name, value, ex=None):
+        self.round_trips += 1
+        self._set(name, value, ex)
+        return True
+
+    def mget(self, names):
+        self.round_trips += 1
+        return [self._values[name] if self._live(name) else None for name in names]
+
+    def exists(self, name):
+        self.round_trips += 1
+        return int(self._live(name))
+
+    def pttl(self, name):
+        self.round_trips += 1
+        if not self._live(name):
+            return -2
+        expires = self._expires.get(name)
+        return int((expires - time.time()) * 1000) if expires is not None else -1
+
+    def scan_iter(self, match='*', count=None):
+        self.round_trips += 1
+        return iter([name.encode('utf-8') for name in list(self._values) if self._live(name) and fnmatch.fnmatchcase(name, match)])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def close(self):
+        pass
+
+
+class FakePipeline(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, name, value, ex=None):
+        self.commands.append((name, value, ex))
+
+    def execute(self):
+        self.client.round_trips += 1
+        for name, value, ex in self.commands:
+            self.client._set(name, value, ex)
+        self.commands = []
+        return [True] * len(self.commands)
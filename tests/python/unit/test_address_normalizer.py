@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from address_normalizer import factorize_addresses, normalize_address
+from cache_handler import CacheHandler
+from cache_utils import CustomTmpFile
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from fake_providers import FakeForwardProvider
+
+
+def test_normalize_address():
+    variants = ['10 Downing St', '10 downing street ', '10 DOWNING ST.', '10  Downing\tStreet']
+    assert set([normalize_address(address) for address in variants]) == {'full-v1|10 downing st'}
+    assert normalize_address('10 Downing Street', level='basic') == 'basic-v1|10 downing street'
+
+
+def test_normalize_unicode_address():
+    # Decomposed and composed accents, full width digits
+    assert normalize_address(u'\uff11\uff12 Rue de l\u2019E\u0301glise') == normalize_address(u'12 rue de l\'\u00c9glise')
+
+
+def test_factorize_addresses():
+    addresses = pd.Series(['10 Downing St', None, '10 downing street', '1 Main Street', '10 Downing St'])
+
+    codes, keys, queries = factorize_addresses(addresses, 'full')
+    assert codes.tolist() == [0, -1, 0, 1, 0]
+    assert keys == ['full-v1|10 downing st', 'full-v1|1 main st']
+    assert queries == ['10 Downing St', '1 Main Street']
+
+    codes, keys, queries = factorize_addresses(addresses, 'none')
+    assert codes.tolist() == [0, -1, 1, 2, 0]
+    assert keys == queries == ['10 Downing St', '10 downing street', '1 Main Street']
+
+
+def test_normalized_forward_geocoding():
+    tmp_cache = CustomTmpFile()
+    cache_dir = tmp_cache.get_temporary_cache_dir()
+    provider = FakeForwardProvider()
+    config = {'address_column': 'address', 'latitude': 'geo_latitude', 'longitude': 'geo_longitude',
+              'batch_enabled': False, 'batch_size': 0, 'address_normalization': 'full'}
+    current_df = pd.DataFrame({'address': ['10 Downing St', '10 downing street ', '10 DOWNING ST.', '3 Main Road']})
+
+    with CacheHandler(cache_dir.name) as cache:
+        # Result cached under the raw address by a previous release
+        cache['3 Main Road'] = [30., 30.]
+        current_df = add_forward_geocode_columns(cache, config, current_df, provider)
+        assert cache['full-v1|3 main rd'] == [30., 30.]
+
+    assert provider.queries == [('10 Downing St',)]
+    assert current_df['geo_latitude'].tolist() == [10., 10., 10., 30.]
+    tmp_cache.clean()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from cache_handler import CacheHandler
+from conftest import get_forward_config, get_reverse_config
+from cache_utils import CustomTmpFile
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from fake_providers import FakeForwardProvider, FakeReverseProvider
+
+
+class FakeBatchProvider(object):
+    """
+    Batch geocoding function answering each query of the batch with `provider`, failing on batches containing `failing`
+    """
+
+    def __init__(self, provider, failing=None):
+        self.provider = provider
+        self.failing = failing
+        self.batches = []
+
+    def __call__(self, queries):
+        self.batches.append(list(queries))
+        if self.failing in queries:
+            raise Exception('Batch timeout')
+        return [self.provider(*query) if isinstance(query, tuple) else self.provider(query) for query in queries]
+
+
+def test_forward_batches():
+    batch_provider = FakeBatchProvider(FakeForwardProvider())
+    addresses = ['{} main street'.format(i % 7) for i in range(20)] + ['unknown']
+    current_df = pd.DataFrame({'address': addresses})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, get_forward_config(batch_enabled=True, batch_size=3), current_df, batch_provider)
+
+    assert [len(batch) for batch in batch_provider.batches] == [3, 3, 2]
+    assert current_df['geo_latitude'].tolist()[:20] == [float(i % 7) for i in range(20)]
+    assert np.isnan(current_df['geo_longitude'].iloc[20])
+
+
+def test_forward_failed_batch():
+    batch_provider = FakeBatchProvider(FakeForwardProvider(), failing='4 main street')
+    current_df = pd.DataFrame({'address': ['{} main street'.format(i) for i in range(6)]})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, get_forward_config(batch_enabled=True, batch_size=3), current_df, batch_provider)
+
+    assert current_df['geo_latitude'].tolist()[:3] == [0., 1., 2.]
+    assert current_df['geo_latitude'].isnull().tolist()[3:] == [True, True, True]
+
+
+def test_reverse_batches_use_cache():
+    tmp_cache = CustomTmpFile()
+    cache_dir = tmp_cache.get_temporary_cache_dir()
+    batch_provider = FakeBatchProvider(FakeReverseProvider())
+    current_df = pd.DataFrame({'latitude': [1., 2., 1., 3.], 'longitude': [5., 5., 5., 5.]})
+
+    with CacheHandler(cache_dir.name) as cache:
+        first_df = add_reverse_geocode_columns(cache, get_reverse_config(batch_enabled=True, batch_size=2), current_df, batch_provider)
+        second_df = add_reverse_geocode_columns(cache, get_reverse_config(batch_enabled=True, batch_size=2), current_df, batch_provider)
+
+    assert [len(batch) for batch in batch_provider.batches] == [2, 1]
+    assert first_df['geo_city'].tolist() == ['city 1', 'city 2', 'city 1', 'city 3']
+    assert second_df['geo_city'].tolist() == first_df['geo_city'].tolist()
+    tmp_cache.clean()
+
+
+def test_concurrent_batches():
+    # Each batch answers its addresses one at a time, the batches being in flight at the same time
+    provider = FakeForwardProvider(delay=0.02)
+    batch_provider = FakeBatchProvider(provider)
+    config = dict(get_forward_config(batch_enabled=True, batch_size=3), batch_concurrency=3)
+    current_df = pd.DataFrame({'address': ['{} main street'.format(i) for i in range(18)]})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, config, current_df, batch_provider)
+
+    assert len(batch_provider.batches) == 6
+    assert provider.max_in_flight == 3
+    assert current_df['geo_latitude'].tolist() == [float(i) for i in range(18)]
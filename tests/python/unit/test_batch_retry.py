@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from batch_retry import BatchRetry
+from cache_handler import CacheHandler
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from fake_providers import FakeForwardProvider, FakeResult
+
+
+class PoisonedBatchProvider(object):
+    """
+    Batch geocoding function timing out on any batch containing one of the `poisoned` addresses
+    """
+
+    def __init__(self, poisoned=()):
+        self.poisoned = set(poisoned)
+        self.provider = FakeForwardProvider()
+        self.batches = []
+
+    def __call__(self, addresses):
+        self.batches.append(list(addresses))
+        if self.poisoned & set(addresses):
+            raise IOError('Batch timeout')
+        return [self.provider(address) for address in addresses]
+
+
+def test_failed_batch_is_bisected():
+    batch_provider = PoisonedBatchProvider(poisoned=['5 main street'])
+    single_provider = FakeForwardProvider()
+    addresses = ['{} main street'.format(i) for i in range(8)]
+
+    results = BatchRetry(batch_provider, single_provider, backoff=0.)(addresses)
+
+    assert [res.lat for res in results[:5]] + [res.lat for res in results[6:]] == [0., 1., 2., 3., 4., 6., 7.]
+    # The poisoned address is isolated, single addresses left being sent to the non-batch endpoint
+    assert [len(batch) for batch in batch_provider.batches] == [8, 4, 4, 2, 2]
+    assert single_provider.queries == [('4 main street',), ('5 main street',)]
+    assert results[5].lat == 5.
+
+
+def test_retry_budget():
+    batch_provider = PoisonedBatchProvider(poisoned=['{} main street'.format(i) for i in range(8)])
+    results = BatchRetry(batch_provider, budget=5, backoff=0.)(['{} main street'.format(i) for i in range(8)])
+
+    assert results == [None] * 8
+    assert len(batch_provider.batches) == 1 + 5
+
+
+def test_batch_http_error_is_retried():
+    answers = [FakeResult(status_code=503), [FakeResult(latlng=[1., -1.])]]
+    results = BatchRetry(lambda addresses: answers.pop(0), backoff=0.)(['1 main street'])
+    assert results[0].lat == 1.
+
+
+def test_throttled_batch_is_not_bisected():
+    batches = []
+
+    def throttling_provider(addresses):
+        batches.append(list(addresses))
+        return FakeResult(status_code=429)
+
+    addresses = ['{} main street'.format(i) for i in range(8)]
+    results = BatchRetry(throttling_provider, FakeForwardProvider(), budget=3, backoff=0.)(addresses)
+
+    assert results == [None] * 8
+    assert [len(batch) for batch in batches] == [8, 8, 8, 8]
+
+
+def test_batch_geocoding_with_retries():
+    config = {'address_column': 'address', 'latitude': 'latitude', 'longitude': 'longitude', 'batch_enabled': True,
+              'batch_size': 4}
+    batch_provider = PoisonedBatchProvider(poisoned=['2 main street'])
+    current_df = pd.DataFrame({'address': ['{} main street'.format(i) for i in range(6)]})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, config, current_df, BatchRetry(batch_provider, backoff=0.))
+
+    assert current_df['latitude'].tolist()[:2] + current_df['latitude'].tolist()[3:] == [0., 1., 3., 4., 5.]
+    assert pd.isnull(current_df['latitude'].iloc[2])
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache_backends import RedisCacheHandler, get_cache_handler
+from cache_handler import CacheHandler
+from cache_transfer import export_cache, import_cache
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from fake_providers import FakeReverseProvider
+from fake_redis import FakeRedis
+
+
+def test_get_set_many():
+    client = FakeRedis()
+    location = (np.float64(40.64749), np.float64(-73.97237))
+    with RedisCacheHandler(client, namespace='geocoder:test:') as cache:
+        cache.set_many([('10 downing street', [51.5, -0.12]), (location, {'city': 'New York'})])
+        assert client.round_trips == 1
+
+        # Another host, without the memory tier of the first one
+        other = RedisCacheHandler(client, namespace='geocoder:test:')
+        cached = other.get_many(['10 downing street', 'unknown', (40.64749, -73.97237)])
+        assert cached == {'10 downing street': [51.5, -0.12], (40.64749, -73.97237): {'city': 'New York'}}
+        assert client.round_trips == 2
+        assert other.hit_counts == {'memory': 0, 'remote': 2, 'miss': 1}
+
+        other.set_no_matches(['nowhere', 'neverland'], 3600)
+        assert cache.get_no_matches(['nowhere', '10 downing street']) == {'nowhere'}
+        assert sorted([key for key in cache.iterkeys() if isinstance(key, str)]) == ['10 downing street']
+        assert len(cache) == 4
+
+
+def test_namespaces():
+    client = FakeRedis()
+    RedisCacheHandler(client, namespace='geocoder:forward:').set_many([('1 main street', [1., -1.])])
+    assert RedisCacheHandler(client, namespace='geocoder:reverse:').get_many(['1 main street']) == {}
+
+
+def test_get_cache_handler():
+    config = {'cache_backend': 'redis', 'cache_enabled': False, 'cache_memory_size': 0}
+    assert isinstance(get_cache_handler(config, forward=False), RedisCacheHandler)
+    with pytest.raises(AttributeError):
+        get_cache_handler(dict(config, cache_backend='memcached'))
+
+
+def test_reverse_geocoding():
+    config = {'lat_column': 'lat', 'lng_column': 'lng', 'batch_enabled': False, 'workers': 1,
+              'features': [{'name': f, 'column': f} for f in ['address', 'city', 'postal', 'state', 'country']]}
+    df = pd.DataFrame({'lat': [1.5, 2.5, 1.5], 'lng': [-1., -2., -1.]})
+    client = FakeRedis()
+
+    provider = FakeReverseProvider()
+    add_reverse_geocode_columns(RedisCacheHandler(client), config, df.copy(), provider)
+    assert provider.calls == 2
+
+    provider = FakeReverseProvider()
+    geocoded = add_reverse_geocode_columns(RedisCacheHandler(client), config, df.copy(), provider)
+    assert provider.calls == 0
+    assert geocoded['city'].tolist() == ['city 1', 'city 2', 'city 1']
+
+
+def test_transfer_from_disk(tmp_path):
+    with CacheHandler(str(tmp_path)) as disk_cache:
+        disk_cache.set_many([('1 main street', [1., -1.])])
+        disk_cache.set_no_matches(['nowhere'], 3600)
+        exported = list(export_cache(disk_cache))
+
+    client = FakeRedis()
+    with RedisCacheHandler(client) as cache:
+        assert import_cache(cache, exported) == 2
+        assert client.round_trips == 1
+        assert cache.get_many(['1 main street']) == {'1 main street': [1., -1.]}
+        assert cache.get_no_matches(['nowhere']) == {'nowhere'}
+        assert 3500 < client.pttl('geocoder:n:"nowhere"') / 1000. <= 3600
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from diskcache import Cache
+
+from cache_handler import CacheHandler
+
+
+def test_get_many(cache_dir):
+    with CacheHandler(cache_dir) as cache:
+        cache['10 downing street'] = [51.5, -0.12]
+        cache[(40.64749, -73.97237)] = {'city': 'New York'}
+
+        cached = cache.get_many(['10 downing street', 'unknown', (40.64749, -73.97237)])
+
+    assert cached == {'10 downing street': [51.5, -0.12], (40.64749, -73.97237): {'city': 'New York'}}
+
+
+def test_set_many(cache_dir):
+    with CacheHandler(cache_dir) as cache:
+        cache.set_many([('1 main street', [1., -1.]), ((1., 2.), {'city': 'city 1'})])
+        cache.set_many({'2 main street': [2., -2.]})
+
+        assert cache['1 main street'] == [1., -1.]
+        assert cache[(1., 2.)] == {'city': 'city 1'}
+        assert cache.get_many(['2 main street']) == {'2 main street': [2., -2.]}
+
+
+def test_disabled_cache():
+    with CacheHandler(None, enabled=False) as cache:
+        cache.set_many([('1 main street', [1., -1.])])
+        assert cache.get_many(['1 main street']) == {}
+        assert '1 main street' not in cache
+        assert cache.get('1 main street') is None
+        assert cache.get('1 main street', expire_time=True) == (None, None)
+
+
+def test_memory_tier(cache_dir):
+    with CacheHandler(cache_dir, memory_size=2) as cache:
+        cache['1 main street'] = [1., -1.]
+        cache.set_many([('2 main street', [2., -2.]), ('3 main street', [3., -3.])])
+
+        assert cache.get_many(['2 main street', '3 main street']) == {'2 main street': [2., -2.], '3 main street': [3., -3.]}
+        assert cache.hit_counts == {'memory': 2, 'disk': 0, 'miss': 0}
+
+        # Least recently used entry was evicted from memory but is read through from disk
+        assert cache['1 main street'] == [1., -1.]
+        assert cache.hit_counts == {'memory': 2, 'disk': 1, 'miss': 0}
+        assert cache['1 main street'] == [1., -1.]
+        assert cache.hit_counts == {'memory': 3, 'disk': 1, 'miss': 0}
+
+        assert cache.get_many(['4 main street']) == {}
+        assert cache.hit_counts == {'memory': 3, 'disk': 1, 'miss': 1}
+
+
+def test_memory_tier_disabled(cache_dir):
+    with CacheHandler(cache_dir, memory_size=0) as cache:
+        cache['1 main street'] = [1., -1.]
+        assert cache['1 main street'] == [1., -1.]
+        assert cache.hit_counts == {'memory': 0, 'disk': 1, 'miss': 0}
+
+
+def test_no_matches(cache_dir):
+    with CacheHandler(cache_dir, memory_size=10) as cache:
+        cache.set_no_matches(['unknown street', (0., 0.)], ttl=60)
+        cache.set_no_matches(['expired street'], ttl=0.01)
+        time.sleep(0.05)
+
+        assert cache.get_no_matches(['unknown street', 'expired street', (0., 0.), 'other']) == {'unknown street', (0., 0.)}
+        # Kept apart from the geocoding results
+        assert cache.get_many(['unknown street']) == {}
+
+
+def test_migrate_values(cache_dir):
+    # Values pickled by previous releases
+    with Cache(cache_dir) as legacy:
+        legacy.set('10 downing street', [51.5, -0.12])
+        legacy.set((1., 2.), {'address': '1 main st', 'city': 'city 1', 'postal': None, 'state': None,
+                              'country': 'country'}, expire=3600)
+        legacy.set(('no-match', 'nowhere'), True, expire=3600, tag='no-match')
+
+    with CacheHandler(cache_dir) as cache:
+        assert cache.get_many(['10 downing street']) == {'10 downing street': [51.5, -0.12]}
+        assert cache.migrate_values() == 2
+        assert cache.migrate_values() == 0
+
+    with CacheHandler(cache_dir) as cache:
+        assert isinstance(Cache.get(cache, ('encoded', '10 downing street')), bytes)
+        assert set(cache.iterkeys()) == {'10 downing street', (1., 2.), ('no-match', 'nowhere')}
+        assert cache['10 downing street'] == [51.5, -0.12]
+        value, expire_time = cache.get((1., 2.), expire_time=True)
+        assert value['city'] == 'city 1' and expire_time > time.time() + 3500
+        assert cache.get_no_matches(['nowhere']) == {'nowhere'}
+
+
+def test_previous_releases_miss_encoded_values(cache_dir):
+    with CacheHandler(cache_dir) as cache:
+        cache.set_many([('10 downing street', [51.5, -0.12])])
+
+    # A host still on a previous release, sharing the cache location
+    with Cache(cache_dir) as legacy:
+        assert legacy.get('10 downing street') is None
+        legacy.set('10 downing street', [51.5, -0.12])
+        legacy.set('1 main street', [1., -1.])
+
+    with CacheHandler(cache_dir) as cache:
+        assert cache.get_many(['10 downing street', '1 main street']) == {'10 downing street': [51.5, -0.12],
+                                                                           '1 main street': [1., -1.]}
+        assert '1 main street' in cache
+        # Keys stored both ways are listed once
+        assert sorted(cache.iterkeys()) == ['1 main street', '10 downing street']
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import pytest
+
+from cache_handler import CacheHandler
+from cache_transfer import export_cache, import_cache
+from cache_utils import CustomTmpFile
+
+
+@pytest.fixture
+def cache_dirs():
+    tmp_caches = [CustomTmpFile(), CustomTmpFile()]
+    yield [tmp_cache.get_temporary_cache_dir().name for tmp_cache in tmp_caches]
+    for tmp_cache in tmp_caches:
+        tmp_cache.clean()
+
+
+def test_export_import(cache_dirs):
+    location = (40.64749, -73.97237)
+    with CacheHandler(cache_dirs[0]) as cache:
+        cache.set_many([('10 downing street', [51.5, -0.12]), ('1 main street', [1., -1.]),
+                        (location, {'address': '1 main st', 'city': 'New York', 'postal': None})])
+        cache.set_no_matches(['nowhere'], 3600)
+        forward = pd.concat(list(export_cache(cache, forward=True, chunksize=2)), ignore_index=True)
+        reverse = pd.concat(list(export_cache(cache, forward=False)), ignore_index=True)
+
+    assert sorted(forward['no_match'].tolist()) == [False, False, True]
+    assert len(reverse) == 1
+
+    # Exports go through a dataset, whose missing values are read back as NaN
+    with CacheHandler(cache_dirs[1]) as cache:
+        assert import_cache(cache, [forward, reverse.astype({'expire_time': float})]) == 4
+        assert cache.get_many(['10 downing street', '1 main street', location]) == {
+            '10 downing street': [51.5, -0.12], '1 main street': [1., -1.],
+            location: {'address': '1 main st', 'city': 'New York', 'postal': None}}
+        assert cache.get_no_matches(['nowhere', '10 downing street']) == {'nowhere'}
+        _, expire_time = cache.get(('no-match', 'nowhere'), expire_time=True)
+        assert expire_time == pytest.approx(forward.loc[forward['no_match'], 'expire_time'].iloc[0], abs=1)
+
+
+def test_import_expired(cache_dirs):
+    exported = pd.DataFrame({'key': ['"nowhere"'], 'value': [None], 'no_match': [True], 'expire_time': [1.]})
+    with CacheHandler(cache_dirs[0]) as cache:
+        assert import_cache(cache, [exported]) == 0
+        assert cache.get_no_matches(['nowhere']) == set()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+
+import numpy as np
+import pytest
+
+from cache_values import decode_value, encode_value
+
+
+def test_latlng():
+    encoded = encode_value([np.float64(48.84444), 2.371837])
+    assert isinstance(encoded, bytes) and len(encoded) == 17
+    assert decode_value(encoded) == [48.84444, 2.371837]
+    assert len(encoded) < len(pickle.dumps([48.84444, 2.371837], protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def test_features():
+    features = {'address': u'203 rue de Bercy', 'city': u'Paris', 'postal': None, 'state': u'Île-de-France',
+                'country': u'France'}
+    encoded = encode_value(features)
+    assert decode_value(encoded) == features
+    assert len(encoded) < len(pickle.dumps(features, protocol=pickle.HIGHEST_PROTOCOL)) / 2
+
+
+@pytest.mark.parametrize('value', [True, {'city': 'Paris'}, [1., 2., 3.], ['48.8', '2.37'],
+                                   {'address': 1, 'city': None, 'postal': None, 'state': None, 'country': None}])
+def test_unencoded_values(value):
+    assert encode_value(value) is value
+    assert decode_value(value) is value
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        decode_value(b'\xff')
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import pytest
+
+from cache_handler import CacheHandler
+from chunk_geocoder import geocode_chunks
+from fake_providers import FakeForwardProvider
+
+
+def get_config(cache_dir):
+    return {'address_column': 'address', 'latitude': 'latitude', 'longitude': 'longitude', 'batch_enabled': False,
+            'workers': 1, 'cache_location': cache_dir, 'cache_enabled': True, 'cache_size': 1000000,
+            'cache_eviction': 'least-recently-stored', 'cache_memory_size': 0}
+
+
+def get_chunks(count=6, rows=5):
+    for i in range(count):
+        df = pd.DataFrame({'id': range(i * rows, (i + 1) * rows)})
+        df['address'] = ['{} main st'.format(n % 12) for n in df['id']]
+        yield df, {'read': 0.}
+
+
+@pytest.mark.parametrize('processes', [1, 3])
+def test_geocode_chunks(cache_dir, processes):
+    config = get_config(cache_dir)
+    results = list(geocode_chunks(get_chunks(), True, config, processes, geocode_function=FakeForwardProvider(0.01)))
+
+    # Chunks come back in input order, each one geocoded
+    assert [df['id'].tolist() for df, _, _, _ in results] == [list(range(i * 5, (i + 1) * 5)) for i in range(6)]
+    for df, chunk, latencies, errors in results:
+        assert df['latitude'].tolist() == [float(n % 12) for n in df['id']]
+        assert chunk['rows'] == 5 and chunk['read'] == 0.
+        assert len(latencies) == chunk['cache_misses'] and not errors
+
+    # Workers share the cache: each distinct address is queried once whatever the process, unless two of them
+    # query it at the same time
+    misses = sum([chunk['cache_misses'] for _, chunk, _, _ in results])
+    assert 12 <= misses <= 12 * processes
+    with CacheHandler(cache_dir) as cache:
+        assert len(cache) == 12
+
+    results = list(geocode_chunks(get_chunks(), True, config, processes, geocode_function=FakeForwardProvider()))
+    assert sum([chunk['cache_misses'] for _, chunk, _, _ in results]) == 0
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from chunk_sizer import ChunkSizer, rechunk
+
+
+def test_memory_bound():
+    sizer = ChunkSizer(memory_budget=1e6, min_size=10, max_size=100000, initial_size=5000, chunks_in_memory=4)
+    df = pd.DataFrame({'address': ['{} main street, springfield'.format(i) for i in range(100)]})
+    sizer.measure_memory(df)
+    assert sizer.size == sizer.memory_size < 5000
+    assert sizer.memory_size * sizer.bytes_per_row * 4 <= 1e6
+
+    # Fast chunks do not grow beyond the memory bound
+    sizer.update(sizer.size, 0.001)
+    assert sizer.size == sizer.memory_size
+
+
+def test_throughput():
+    sizer = ChunkSizer(min_size=100, max_size=10000, initial_size=1000, target_seconds=10)
+    sizer.update(1000, 1.)
+    assert sizer.size == 2000
+    sizer.update(2000, 1.)
+    assert sizer.size == 4000
+    sizer.update(4000, 400.)
+    assert sizer.size == 100
+    sizer.update(100, 0.)
+    assert sizer.size == 100
+
+
+def test_rechunk():
+    sizer = ChunkSizer(min_size=1, max_size=100, initial_size=4)
+    dataframes = [pd.DataFrame({'id': range(start, start + 3)}) for start in range(0, 15, 3)]
+
+    chunks = []
+    for chunk in rechunk(dataframes, sizer):
+        chunks.append(chunk['id'].tolist())
+        sizer.size = 6
+    assert chunks == [[0, 1, 2, 3], [4, 5, 6, 7, 8, 9], [10, 11, 12, 13, 14]]
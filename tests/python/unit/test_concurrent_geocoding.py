@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from cache_handler import CacheHandler
+from conftest import get_forward_config, get_reverse_config
+from cache_utils import CustomTmpFile
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from fake_providers import FakeForwardProvider, FakeReverseProvider
+
+
+def test_forward_concurrent_keeps_row_order():
+    provider = FakeForwardProvider(delay=0.05)
+    current_df = pd.DataFrame({'address': ['{} main street'.format(i) for i in range(20)] + ['unknown']})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, get_forward_config(workers=8), current_df, provider)
+
+    assert provider.max_in_flight > 1
+    assert current_df['geo_latitude'].tolist()[:20] == [float(i) for i in range(20)]
+    assert current_df['geo_longitude'].tolist()[:20] == [-float(i) for i in range(20)]
+    assert pd.isnull(current_df['geo_latitude'].iloc[20])
+
+
+def test_forward_concurrent_writes_cache():
+    tmp_cache = CustomTmpFile()
+    cache_dir = tmp_cache.get_temporary_cache_dir()
+    provider = FakeForwardProvider()
+    current_df = pd.DataFrame({'address': ['{} main street'.format(i) for i in range(5)]})
+
+    with CacheHandler(cache_dir.name) as cache:
+        add_forward_geocode_columns(cache, get_forward_config(workers=4), current_df, provider)
+        assert cache['3 main street'] == [3.0, -3.0]
+        add_forward_geocode_columns(cache, get_forward_config(workers=4), current_df, provider)
+
+    assert provider.calls == 5
+    tmp_cache.clean()
+
+
+def test_reverse_concurrent_keeps_row_order():
+    provider = FakeReverseProvider(delay=0.05)
+    current_df = pd.DataFrame({'latitude': [float(i) for i in range(20)], 'longitude': [1.0] * 20})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_reverse_geocode_columns(cache, get_reverse_config(workers=8), current_df, provider)
+
+    assert provider.max_in_flight > 1
+    assert current_df['geo_city'].tolist() == ['city {}'.format(i) for i in range(20)]
+    assert (current_df['geo_country'] == 'country').all()
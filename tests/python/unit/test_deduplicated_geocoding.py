@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from cache_handler import CacheHandler
+from conftest import get_forward_config, get_reverse_config
+from diskcache import Cache
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from fake_providers import FakeForwardProvider, FakeReverseProvider
+
+
+REVERSE_FEATURES = [{'name': 'address', 'column': 'geo_address'}, {'name': 'city', 'column': 'geo_city'}]
+
+
+def test_forward_duplicates_are_geocoded_once():
+    provider = FakeForwardProvider()
+    addresses = ['1 main street', '2 main street', '1 main street', None, '2 main street', '1 main street']
+    current_df = pd.DataFrame({'address': addresses})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, get_forward_config(), current_df, provider)
+
+    assert sorted(provider.queries) == [('1 main street',), ('2 main street',)]
+    assert current_df['geo_latitude'].tolist()[:3] == [1., 2., 1.]
+    assert current_df['geo_longitude'].tolist()[4:] == [-2., -1.]
+    assert np.isnan(current_df['geo_latitude'].iloc[3])
+
+
+def test_forward_filled_rows_are_kept():
+    provider = FakeForwardProvider()
+    current_df = pd.DataFrame({'address': ['1 main street', '1 main street'],
+                               'geo_latitude': [10., np.nan], 'geo_longitude': [20., np.nan]})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, get_forward_config(), current_df, provider)
+
+    assert provider.calls == 1
+    assert current_df['geo_latitude'].tolist() == [10., 1.]
+    assert current_df['geo_longitude'].tolist() == [20., -1.]
+
+
+def test_reverse_duplicates_are_geocoded_once():
+    provider = FakeReverseProvider()
+    N = 100
+    current_df = pd.DataFrame({'latitude': [40.64749] * N + [np.nan, 41.5],
+                               'longitude': [-73.97237] * N + [-73.9, -73.9]})
+
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_reverse_geocode_columns(cache, get_reverse_config(features=REVERSE_FEATURES), current_df, provider)
+
+    assert provider.calls == 2
+    assert (current_df['geo_city'].iloc[:N] == 'city 40').all()
+    assert pd.isnull(current_df['geo_city'].iloc[N])
+    assert current_df['geo_city'].iloc[N + 1] == 'city 41'
+
+
+def test_reverse_cache_of_previous_releases(cache_dir):
+    features = {'address': '40.5 -73.9', 'city': 'cached city', 'postal': None, 'state': None, 'country': None}
+    # Previous releases keyed locations by the values of the rows, Python floats unless all columns are numeric
+    with Cache(cache_dir) as cache:
+        cache.set((40.5, -73.9), features)
+        cache.set((np.float64(41.5), np.float64(-73.9)), dict(features, city='cached numeric city'))
+
+    provider = FakeReverseProvider()
+    with CacheHandler(cache_dir) as cache:
+        current_df = add_reverse_geocode_columns(cache, get_reverse_config(features=REVERSE_FEATURES), pd.DataFrame(
+            {'id': ['a'], 'latitude': [40.5], 'longitude': [-73.9]}), provider)
+        assert current_df['geo_city'].tolist() == ['cached city']
+
+        current_df = add_reverse_geocode_columns(cache, get_reverse_config(features=REVERSE_FEATURES), pd.DataFrame(
+            {'latitude': [41.5], 'longitude': [-73.9]}), provider)
+        assert current_df['geo_city'].tolist() == ['cached numeric city']
+        # Stored again under the Python key
+        assert cache.get_many([(41.5, -73.9)])[(41.5, -73.9)]['city'] == 'cached numeric city'
+    assert provider.calls == 0
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import json
+import threading
+
+import geocoder
+import pandas as pd
+import pytest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from cache_handler import CacheHandler
+from dataframe_forward_geocoding import add_forward_geocode_columns, get_forward_geocode_function
+from dku_io import get_config_forward_geocoding
+
+
+class StubNominatimHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in of the Nominatim search API, counting the TCP connections it receives
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.queries += 1
+        body = json.dumps([{'lat': '48.84444', 'lon': '2.371837', 'display_name': 'Rue de Bercy, Paris',
+                            'importance': 0.5, 'address': {'city': 'Paris'}}]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = StubServer(('127.0.0.1', 0), StubNominatimHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.queries = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    url = 'http://127.0.0.1:{}/search'.format(server.server_address[1])
+    monkeypatch.setattr(geocoder, 'osm', functools.partial(geocoder.osm, url=url))
+    yield server
+    server.shutdown()
+
+
+def test_connections_are_reused(stub_server):
+    plugin_config = {'cache_location': 'original'}
+    recipe_config = {'provider': 'osm', 'cache_enabled': False, 'address_column': 'address', 'workers': 4,
+                     'rate_limit': 1000}
+    config = get_config_forward_geocoding(recipe_config=recipe_config, plugin_config=plugin_config)
+    geocode_function = get_forward_geocode_function(config)
+
+    N = 40
+    current_df = pd.DataFrame({'address': ['{} rue de Bercy, Paris'.format(i) for i in range(N)]})
+    with CacheHandler(None, enabled=False) as cache:
+        current_df = add_forward_geocode_columns(cache, config, current_df, geocode_function)
+
+    assert stub_server.queries == N
+    assert stub_server.connections <= config['workers']
+    assert (abs(current_df['latitude'] - 48.84444) < 1e-6).all()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from incremental import GeocodedKeys, get_key_columns
+
+
+def test_geocoded_keys():
+    # Output read back chunk by chunk, with the geocoding columns and types inferred differently than the input
+    output_chunks = [
+        pd.DataFrame({'id': ['1', '2'], 'address': ['1 main street', '2 main street'], 'latitude': [1., 2.]}),
+        pd.DataFrame({'id': ['2', '3'], 'address': ['2 main street', None], 'latitude': [2., np.nan]})
+    ]
+    geocoded_keys = GeocodedKeys.from_dataframes(output_chunks, ['id', 'address'])
+    assert len(geocoded_keys) == 3
+
+    input_df = pd.DataFrame({'id': [1, 2, 3, 4, 1], 'address': ['1 main street', '2 main street', None, '4 main street',
+                                                                 '1 other street']})
+    assert geocoded_keys.contains(input_df, ['id', 'address']).tolist() == [True, True, True, False, False]
+
+
+def test_geocoded_keys_of_other_dtypes():
+    # Integer column read as float in a chunk of the output holding a missing value, or as strings
+    output_chunks = [
+        pd.DataFrame({'id': ['a', 'b', 'c'], 'zip': [75012., np.nan, 75013.]}),
+        pd.DataFrame({'id': ['d', 'e'], 'zip': ['75014', '1.5']})
+    ]
+    geocoded_keys = GeocodedKeys.from_dataframes(output_chunks, ['id', 'zip'])
+
+    input_df = pd.DataFrame({'id': ['a', 'c', 'd', 'e', 'f'], 'zip': [75012, 75013, 75014, 1.5, 75012]})
+    assert geocoded_keys.contains(input_df, ['id', 'zip']).tolist() == [True, True, True, True, False]
+    input_df = pd.DataFrame({'id': ['b'], 'zip': [None]})
+    assert geocoded_keys.contains(input_df, ['id', 'zip']).tolist() == [True]
+
+
+def test_no_geocoded_keys():
+    geocoded_keys = GeocodedKeys.from_dataframes([], ['id'])
+    assert geocoded_keys.contains(pd.DataFrame({'id': [1, 2]}), ['id']).tolist() == [False, False]
+
+
+def test_default_key_columns():
+    # Input already holding the geocoding columns, empty, as when the recipe ran on a previous output
+    input_df = pd.DataFrame({'id': [1, 2], 'address': ['1 main street', '2 main street'],
+                             'latitude': [np.nan, np.nan], 'longitude': [np.nan, np.nan]})
+    config = {'incremental_key_columns': [], 'latitude': 'latitude', 'longitude': 'longitude'}
+    key_columns = get_key_columns(config, input_df.columns.tolist())
+    assert key_columns == ['id', 'address']
+
+    output_df = input_df.assign(latitude=[1., 2.], longitude=[-1., -2.])
+    geocoded_keys = GeocodedKeys.from_dataframes([output_df], key_columns)
+    assert geocoded_keys.contains(input_df, key_columns).tolist() == [True, True]
+
+    config = {'incremental_key_columns': [], 'features': [{'name': 'city', 'column': 'geo_city'}]}
+    assert get_key_columns(config, ['latitude', 'longitude', 'geo_city'], forward=False) == ['latitude', 'longitude']
+    assert get_key_columns(dict(config, incremental_key_columns=['id']), ['id', 'geo_city'], forward=False) == ['id']
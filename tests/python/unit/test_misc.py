@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from misc import get_empty_mask, is_empty, is_empty_column
+
+
+def test_is_empty_column():
+    df = pd.DataFrame({
+        'float': [1.5, np.nan, 0., -2.],
+        'int': [1, 0, 2, 3],
+        'string': ['1 main st', '', None, np.nan],
+        'mixed': [1.5, 'paris', None, 0],
+        'empty': [None, None, None, None]
+    })
+    for column in df.columns:
+        assert is_empty_column(df[column]).tolist() == [bool(is_empty(v)) for v in df[column]], column
+
+
+def test_get_empty_mask():
+    df = pd.DataFrame({'latitude': [1., np.nan, 3., np.nan], 'longitude': [1., 2., np.nan, np.nan]})
+    assert get_empty_mask(df, ['latitude', 'longitude']).tolist() == [False, True, True, True]
+    assert get_empty_mask(df.iloc[:0], ['latitude']).tolist() == []
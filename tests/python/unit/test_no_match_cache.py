@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from cache_handler import CacheHandler
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from fake_providers import FakeForwardProvider, FakeResult, FakeReverseProvider
+
+
+class UnreliableForwardProvider(FakeForwardProvider):
+    """
+    Fails with a server error on addresses starting with 'flaky', and answers with the errors of Google on addresses
+    starting with 'quota' or 'zero'
+    """
+
+    def answer(self, address):
+        if address.startswith('flaky'):
+            return FakeResult(status_code=503)
+        if address.startswith('quota'):
+            return FakeResult(error='OVER_QUERY_LIMIT')
+        if address.startswith('zero'):
+            return FakeResult(error='ZERO_RESULTS')
+        return super(UnreliableForwardProvider, self).answer(address)
+
+
+class BatchProvider(object):
+    """
+    Batch version of `provider`, answering each batch with `status_code`
+    """
+
+    def __init__(self, provider, status_code=200):
+        self.provider = provider
+        self.status_code = status_code
+
+    def __call__(self, queries):
+        results = BatchResults([self.provider(*query) for query in queries])
+        results.status_code = self.status_code
+        return results
+
+
+class BatchResults(list):
+    pass
+
+
+def geocode_addresses(cache, config, addresses, provider):
+    current_df = pd.DataFrame({'address': addresses})
+    return add_forward_geocode_columns(cache, config, current_df, provider)
+
+
+def test_only_no_matches_are_remembered(cache_dir):
+    config = {'address_column': 'address', 'latitude': 'latitude', 'longitude': 'longitude', 'batch_enabled': False,
+              'no_match_ttl': 3600}
+    addresses = ['1 main street', 'unknown street', 'flaky street', 'quota street', 'zero street']
+
+    provider = UnreliableForwardProvider()
+    with CacheHandler(cache_dir) as cache:
+        current_df = geocode_addresses(cache, config, addresses, provider)
+        assert current_df['latitude'].tolist()[0] == 1.
+        assert current_df['latitude'].isnull().tolist() == [False, True, True, True, True]
+        assert cache.get_no_matches(addresses) == {'unknown street', 'zero street'}
+
+    provider = UnreliableForwardProvider()
+    with CacheHandler(cache_dir) as cache:
+        geocode_addresses(cache, config, addresses, provider)
+    # Transient errors are queried again, addresses without match are not
+    assert sorted(provider.queries) == [('flaky street',), ('quota street',)]
+
+    provider = UnreliableForwardProvider()
+    with CacheHandler(cache_dir) as cache:
+        geocode_addresses(cache, dict(config, no_match_ttl=0), addresses, provider)
+    assert sorted(provider.queries) == [('flaky street',), ('quota street',), ('unknown street',), ('zero street',)]
+
+
+def test_batch_no_matches(cache_dir):
+    config = {'lat_column': 'latitude', 'lng_column': 'longitude', 'batch_enabled': True, 'batch_size': 10,
+              'features': [{'name': 'city', 'column': 'geo_city'}], 'no_match_ttl': 3600}
+    provider = FakeReverseProvider()
+    provider.answer = lambda lat, lng: FakeResult(city='city 1') if lat == 1. else FakeResult()
+    current_df = pd.DataFrame({'latitude': [1., 2.], 'longitude': [1., 2.]})
+    # Cache keys of locations are made of Python floats
+    locations = [(1., 1.), (2., 2.)]
+
+    with CacheHandler(cache_dir) as cache:
+        # Items of failed batches are not remembered
+        add_reverse_geocode_columns(cache, config, current_df.copy(), BatchProvider(provider, status_code=500))
+        assert cache.get_no_matches(locations) == set()
+
+        current_df = add_reverse_geocode_columns(cache, config, current_df, BatchProvider(provider))
+        assert current_df['geo_city'].tolist()[0] == 'city 1'
+        assert cache.get_no_matches(locations) == {locations[1]}
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache_handler import CacheHandler
+from dataframe_forward_geocoding import add_forward_geocode_columns, get_forward_geocode_function
+from dku_io import get_config_forward_geocoding
+from fake_providers import FakeForwardProvider
+from offline_forward_geocoding import AddressIndex
+
+import geocoder
+
+
+@pytest.fixture
+def reference_df():
+    return pd.DataFrame({
+        'address': ['10 Downing Street, London', '221B Baker Street, London', '1600 Pennsylvania Avenue NW, Washington',
+                    '10 downing st london', 'Unlocated Road', '5 Avenue Anatole France, Paris'],
+        'lat': [51.5034, 51.5238, 38.8977, 0., 12., 48.8584],
+        'lng': [-0.1276, -0.1586, -77.0365, 0., None, 2.2945]
+    })
+
+
+def test_exact_prefix_and_trigram_matches(reference_df):
+    index = AddressIndex.build(reference_df['address'], reference_df['lat'], reference_df['lng'])
+    matches = index.geocode(['10 DOWNING ST. LONDON', '221B Baker Street', '1600 Pensylvania Ave NW, Washington',
+                             '5 avenue anatole france', 'Unlocated Road', '', 'Somewhere else entirely'])
+
+    # The first coordinates of duplicated addresses are kept
+    assert (matches[0].lat, matches[0].lng, matches[0].score) == (51.5034, -0.1276, 1.)
+    assert (matches[1].lat, matches[1].lng) == (51.5238, -0.1586)
+    assert (matches[2].lat, matches[2].lng) == (38.8977, -77.0365) and 0.8 <= matches[2].score < 1.
+    assert (matches[3].lat, matches[3].lng) == (48.8584, 2.2945)
+    # Reference addresses without coordinates are not indexed
+    assert [match.lat for match in matches[4:]] == [None, None, None]
+
+
+def test_saved_index_is_memory_mapped(reference_df, tmp_path):
+    index_dir = os.path.join(str(tmp_path), 'index')
+    AddressIndex.load_or_build(reference_df, 'address', 'lat', 'lng', index_dir)
+    index = AddressIndex.load_or_build(reference_df, 'address', 'lat', 'lng', index_dir)
+    assert isinstance(index.arrays['postings'], np.memmap)
+    assert index.geocode(['221b baker st london'])[0].lat == 51.5238
+
+
+def test_offline_recipe_with_fallback(reference_df, monkeypatch):
+    fallback = FakeForwardProvider()
+    monkeypatch.setattr(geocoder, 'osm', lambda address, **kwargs: fallback(address))
+
+    plugin_config = {'cache_location': 'original'}
+    recipe_config = {'provider': 'offline', 'fallback_provider': 'osm', 'cache_enabled': True,
+                     'address_column': 'address', 'reference_address_column': 'address',
+                     'reference_lat_column': 'lat', 'reference_lng_column': 'lng'}
+    config = get_config_forward_geocoding(recipe_config=recipe_config, plugin_config=plugin_config)
+    assert config['batch_enabled'] and config['rate_limit'] == 1
+    # Matches of the reference dataset are not shared with the remote providers through the cache
+    assert not config['cache_enabled']
+    geocode_function = get_forward_geocode_function(config, reference_df)
+
+    current_df = pd.DataFrame({'address': ['10 Downing Street, London', '7 unknown street', '10 downing street london']})
+    with CacheHandler(config['cache_location'], enabled=config['cache_enabled']) as cache:
+        current_df = add_forward_geocode_columns(cache, config, current_df, geocode_function)
+
+    assert current_df['latitude'].tolist() == [51.5034, 7., 51.5034]
+    assert current_df['longitude'].tolist() == [-0.1276, -7., -0.1276]
+    # Only the address missing from the reference dataset is sent to the fallback provider
+    assert fallback.calls == 1
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache_handler import CacheHandler
+from dataframe_reverse_geocoding import add_reverse_geocode_columns, get_reverse_geocode_function
+from dku_io import get_config_reverse_geocoding
+from offline_reverse_geocoding import GazetteerIndex
+
+CITIES = [
+    ('5110302', 'Brooklyn', 40.6501, -73.94958, 'US', 'NY'),
+    ('5128581', 'New York City', 40.71427, -74.00597, 'US', 'NY'),
+    ('2988507', 'Paris', 48.85341, 2.3488, 'FR', '11'),
+    ('2193733', 'Auckland', -36.84853, 174.76349, 'NZ', 'E7'),
+    ('4031574', 'Apia', -13.83333, -171.76666, 'WS', '11'),
+    ('2198148', 'Vunisea', -16.5, 179.9, 'FJ', '03')
+]
+# Features of other classes than populated places, such as a lake, to be left out of the index
+OTHER_FEATURES = [
+    ('5117585', 'Prospect Park Lake', 40.65993, -73.96897, 'US', 'NY', 'H')
+]
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    """
+    Extract of the GeoNames cities1000.txt dump
+    """
+    path = os.path.join(str(tmp_path), 'cities.txt')
+    with open(path, 'w') as f:
+        places = [city + ('P',) for city in CITIES] + OTHER_FEATURES
+        for geonameid, name, lat, lng, country, admin1, feature_class in places:
+            f.write('\t'.join([geonameid, name, name, '', str(lat), str(lng), feature_class, 'PPL', country, '', admin1,
+                               '', '', '', '1000', '', '10', 'UTC', '2020-01-01']) + '\n')
+    return path
+
+
+@pytest.fixture
+def postal_gazetteer(tmp_path):
+    """
+    Extract of the GeoNames postal codes dump
+    """
+    path = os.path.join(str(tmp_path), 'postal.txt')
+    with open(path, 'w') as f:
+        f.write('\t'.join(['US', '11218', 'Brooklyn', 'New York', 'NY', 'Kings', '047', '', '', '40.6432', '-73.9771', '']) + '\n')
+        f.write('\t'.join(['US', '10001', 'New York', 'New York', 'NY', 'New York', '061', '', '', '40.7484', '-73.9967', '']) + '\n')
+    return path
+
+
+def test_nearest(gazetteer):
+    index = GazetteerIndex.build(gazetteer)
+    assert len(index.arrays['keys']) == len(CITIES)
+    nearest = index.nearest(np.array([40.66, 48.8, 0., np.nan]), np.array([-73.97, 2.3, 0., 1.]))
+    assert index.arrays['city'][nearest[0]] == 'Brooklyn'
+    assert index.arrays['city'][nearest[1]] == 'Paris'
+    assert nearest[2:].tolist() == [-1, -1]
+
+
+def test_nearest_by_groups_of_candidates(gazetteer):
+    index = GazetteerIndex.build(gazetteer)
+    lats = np.array([40.64749, np.nan, 40.75, 48.8, -16.5, 0.])
+    lngs = np.array([-73.97237, 1., -74., 2.3, -179.9, 0.])
+    expected = index.nearest(lats, lngs)
+    # A single location per group, whatever the number of its candidates
+    index.max_candidates = 1
+    assert index.nearest(lats, lngs).tolist() == expected.tolist()
+    index.max_candidates = 3
+    assert index.nearest(lats, lngs).tolist() == expected.tolist()
+
+
+def test_nearest_across_antimeridian(gazetteer):
+    index = GazetteerIndex.build(gazetteer)
+    nearest = index.nearest(np.array([-16.5, -13.8]), np.array([-179.9, -171.7]))
+    assert [index.arrays['city'][n] for n in nearest] == ['Vunisea', 'Apia']
+
+
+def test_saved_index_is_memory_mapped(gazetteer, tmp_path):
+    index_dir = os.path.join(str(tmp_path), 'index')
+    GazetteerIndex.load_or_build(gazetteer, index_dir)
+    index = GazetteerIndex.load_or_build(gazetteer, index_dir)
+    assert isinstance(index.arrays['lat'], np.memmap)
+    assert index.reverse_geocode([(48.85, 2.35)])[0].city == 'Paris'
+
+
+def test_offline_recipe(postal_gazetteer):
+    plugin_config = {'cache_location': 'original'}
+    recipe_config = {'provider': 'offline', 'gazetteer_path': postal_gazetteer, 'cache_enabled': True,
+                     'lat_column': 'latitude', 'lng_column': 'longitude', 'city': True, 'postal': True, 'state': True,
+                     'country': True}
+    config = get_config_reverse_geocoding(recipe_config=recipe_config, plugin_config=plugin_config)
+    assert config['batch_enabled'] and not config['cache_enabled']
+    geocode_function = get_reverse_geocode_function(config)
+
+    current_df = pd.DataFrame({'latitude': [40.64749, 40.75, 40.64749], 'longitude': [-73.97237, -73.99, -73.97237]})
+    with CacheHandler(config['cache_location'], enabled=config['cache_enabled']) as cache:
+        current_df = add_reverse_geocode_columns(cache, config, current_df, geocode_function)
+
+    assert current_df['postal'].tolist() == ['11218', '10001', '11218']
+    assert current_df['city'].tolist() == ['Brooklyn', 'New York', 'Brooklyn']
+    assert (current_df['state'] == 'New York').all()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+from parallel_utils import BackgroundWriter, parallel_map, prefetch
+
+
+class FakeWriter(object):
+
+    def __init__(self, delay=0., failing=None):
+        self.delay = delay
+        self.failing = failing
+        self.written = []
+        self.closed = False
+
+    def write_dataframe(self, df):
+        time.sleep(self.delay)
+        if df == self.failing:
+            raise IOError('Disk full')
+        self.written.append(df)
+
+    def close(self):
+        self.closed = True
+
+
+def test_parallel_map_keeps_order():
+    assert parallel_map(lambda x: time.sleep(0.01 * (5 - x)) or x * 2, range(5), workers=5) == [0, 2, 4, 6, 8]
+    assert parallel_map(lambda x: x * 2, range(5), workers=1) == [0, 2, 4, 6, 8]
+
+
+def test_prefetch_is_bounded():
+    produced = []
+
+    def produce():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    items = prefetch(produce(), size=2)
+    assert next(items) == 0
+    time.sleep(0.1)
+    # One element consumed, two waiting in the queue, one blocked on insertion
+    assert len(produced) == 4
+    assert list(items) == list(range(1, 10))
+
+
+def test_prefetch_raises_errors():
+    def produce():
+        yield 1
+        raise ValueError('Read error')
+
+    items = prefetch(produce())
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_background_writer_overlaps_writes():
+    writer = FakeWriter(delay=0.05)
+    background_writer = BackgroundWriter(writer, size=1)
+
+    start_time = time.time()
+    background_writer.write_dataframe(1)
+    background_writer.write_dataframe(2)
+    assert time.time() - start_time < 0.05
+    assert threading.active_count() > 1
+
+    background_writer.close()
+    assert writer.written == [1, 2]
+    assert writer.closed
+
+
+def test_background_writer_raises_errors():
+    writer = FakeWriter(failing=1)
+    background_writer = BackgroundWriter(writer)
+    background_writer.write_dataframe(1)
+    background_writer.write_dataframe(2)
+    with pytest.raises(IOError):
+        background_writer.close()
+    assert writer.written == []
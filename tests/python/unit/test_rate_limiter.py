@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from rate_limiter import RateLimiter, get_retry_after
+
+
+class FakeResponse(object):
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+
+class FakeResult(object):
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.response = FakeResponse(headers)
+
+
+def test_queries_are_paced():
+    limiter = RateLimiter(rate=20)
+    function = limiter.wrap(lambda address: FakeResult())
+
+    start_time = time.monotonic()
+    for i in range(11):
+        function('address')
+    assert time.monotonic() - start_time >= 0.45
+
+
+def test_no_rate_does_not_pace():
+    limiter = RateLimiter()
+    function = limiter.wrap(lambda address: FakeResult())
+
+    start_time = time.monotonic()
+    for i in range(100):
+        function('address')
+    assert time.monotonic() - start_time < 0.1
+
+
+def test_throttled_queries_are_retried():
+    answers = [FakeResult(429, {'Retry-After': '0.1'}), FakeResult(429), FakeResult(200)]
+    limiter = RateLimiter(rate=100, backoff=0.05)
+    function = limiter.wrap(lambda address: answers.pop(0))
+
+    start_time = time.monotonic()
+    assert function('address').status_code == 200
+    assert time.monotonic() - start_time >= 0.15
+    assert limiter.rate < 100
+
+
+def test_retries_are_bounded():
+    limiter = RateLimiter(max_retries=2, backoff=0.01)
+    calls = []
+    function = limiter.wrap(lambda address: calls.append(address) or FakeResult(429))
+
+    assert function('address').status_code == 429
+    assert len(calls) == 3
+
+
+def test_rate_recovers_after_throttling():
+    limiter = RateLimiter(rate=100)
+    limiter.throttle(0)
+    assert limiter.rate == 50
+    for i in range(20):
+        limiter.release()
+    assert limiter.rate == 100
+
+
+def test_retry_after():
+    assert get_retry_after(FakeResult(429, {'Retry-After': '3'})) == 3
+    assert get_retry_after(FakeResult(429, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0
+    assert get_retry_after(FakeResult(429)) is None
+    assert get_retry_after(None) is None
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import geocoder
+import pandas as pd
+
+from cache_handler import CacheHandler
+from chunk_geocoder import ChunkGeocoder
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from fake_providers import FakeForwardProvider, FakeResult
+from recipe_metrics import RecipeMetrics, TimedCache
+
+
+class FlakyProvider(FakeForwardProvider):
+    """
+    Fails on addresses starting with 'error', is throttled on the ones starting with 'busy'
+    """
+
+    def answer(self, address):
+        if address.startswith('error'):
+            raise ValueError(address)
+        if address.startswith('busy'):
+            return FakeResult(status_code=429)
+        return super(FlakyProvider, self).answer(address)
+
+
+def test_chunk_metrics(cache_dir):
+    config = {'address_column': 'address', 'latitude': 'latitude', 'longitude': 'longitude', 'batch_enabled': False,
+              'workers': 2}
+    provider = FlakyProvider(delay=0.05)
+    metrics = RecipeMetrics()
+    geocode_function = metrics.wrap(provider)
+
+    with CacheHandler(cache_dir) as cache:
+        timed_cache = TimedCache(cache, metrics)
+        for addresses in [['1 main st', '2 main st', 'error', 'busy', '1 main st'], ['1 main st', None]]:
+            metrics.start_chunk(cache.hit_counts)
+            current_df = add_forward_geocode_columns(timed_cache, config, pd.DataFrame({'address': addresses}), geocode_function)
+            metrics.end_chunk(len(current_df), int(current_df['latitude'].isnull().sum()), cache.hit_counts)
+
+    chunks = metrics.to_dataframe()
+    assert chunks['rows'].tolist() == [5, 2]
+    assert chunks['not_geocoded'].tolist() == [2, 1]
+    assert chunks['cache_hits'].tolist() == [0, 1]
+    assert chunks['cache_misses'].tolist() == [4, 0]
+    assert (chunks.loc[0, ['cache', 'provider']] > 0).all() and chunks.loc[1, 'provider'] == 0
+    # Concurrent calls overlap, the provider stage is shorter than the sum of their latencies
+    assert chunks.loc[0, 'provider'] < 4 * 0.05
+
+    summary = metrics.summary()
+    assert summary['rows'] == 7 and summary['provider_calls'] == 4
+    assert summary['errors'] == {'ValueError': 1, 'HTTP 429': 1}
+    assert summary['provider_latency_seconds']['p50'] >= 0.05
+    assert summary['cache_hits'] == {'memory': 0, 'disk': 1, 'miss': 4}
+
+
+def get_provider_config(cache_dir, **kwargs):
+    config = {'provider': 'osm', 'api_key': None, 'address_column': 'address', 'latitude': 'latitude',
+              'longitude': 'longitude', 'batch_enabled': True, 'virtual_batch': True, 'batch_size': 10,
+              'batch_concurrency': 1, 'workers': 2, 'rate_limit': None, 'cache_location': cache_dir,
+              'cache_enabled': True, 'cache_size': 1000000, 'cache_eviction': 'least-recently-stored',
+              'cache_memory_size': 0}
+    config.update(kwargs)
+    return config
+
+
+def test_virtual_batch_metrics(cache_dir, monkeypatch):
+    provider = FlakyProvider()
+    monkeypatch.setattr(geocoder, 'osm', lambda address, **kwargs: provider(address))
+    chunk_geocoder = ChunkGeocoder(True, get_provider_config(cache_dir))
+    current_df = pd.DataFrame({'address': ['1 main st', 'error 1', '2 main st', 'error 2', '1 main st']})
+
+    _, chunk, latencies, errors = chunk_geocoder(current_df)
+    chunk_geocoder.close()
+
+    # Each query of the virtual batch is timed and its error counted, as without batch
+    assert len(latencies) == 4
+    assert errors == {'ValueError': 2}
+
+
+def test_batch_retry_metrics(cache_dir, monkeypatch):
+    provider = FlakyProvider()
+
+    def batch_provider(query, method=None, **kwargs):
+        if method != 'batch':
+            return provider(query)
+        if any([address.startswith('error') for address in query]):
+            raise IOError('Batch timeout')
+        return [provider(address) for address in query]
+
+    monkeypatch.setattr(geocoder, 'mapquest', batch_provider)
+    config = get_provider_config(cache_dir, provider='mapquest', virtual_batch=False, batch_timeout=30)
+    chunk_geocoder = ChunkGeocoder(True, config)
+    chunk_geocoder.geocode_function.backoff = 0.
+    current_df = pd.DataFrame({'address': ['1 main st', 'error 1', '2 main st', '3 main st']})
+
+    _, chunk, latencies, errors = chunk_geocoder(current_df)
+    chunk_geocoder.close()
+
+    # Batches of 4 then 2 addresses fail, the single addresses left going to the non-batch endpoint
+    assert len(latencies) == 5
+    assert errors == {'OSError': 2, 'ValueError': 1}
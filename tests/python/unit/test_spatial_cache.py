@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from cache_handler import CacheHandler
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from fake_providers import FakeReverseProvider
+from spatial_cache import GridIndex, SpatialCache, haversine_distance, is_location
+
+
+def test_haversine_distance():
+    # One thousandth of a degree of latitude is about 111 meters
+    assert abs(haversine_distance((40.647, -73.972), (40.648, -73.972)) - 111.2) < 0.5
+
+
+def test_is_location():
+    assert is_location((40.64749, -73.97237))
+    assert not is_location('10 downing street')
+    assert not is_location((float('nan'), 1.))
+
+
+def test_grid_index_nearest():
+    index = GridIndex(50)
+    index.add((40.64749, -73.97237))
+    index.add((40.64779, -73.97237))
+
+    assert index.nearest((40.64750, -73.97238)) == (40.64749, -73.97237)
+    assert index.nearest((40.64785, -73.97237)) == (40.64779, -73.97237)
+    assert index.nearest((40.64900, -73.97237)) is None
+
+
+def test_grid_index_near_poles():
+    index = GridIndex(100)
+    index.add((78.2232, 15.6267))
+    # 0.003 degrees of longitude are about 68 meters at this latitude
+    assert index.nearest((78.2232, 15.6297)) == (78.2232, 15.6267)
+
+
+def test_grid_index_across_antimeridian():
+    index = GridIndex(50)
+    index.add((10., -179.9999))
+    assert index.nearest((10., 179.9999)) == (10., -179.9999)
+    index.add((-20., 179.9999))
+    assert index.nearest((-20., -180.)) == (-20., 179.9999)
+
+
+def test_spatial_cache_built_from_cache(cache_dir):
+    with CacheHandler(cache_dir) as cache:
+        cache[(40.64749, -73.97237)] = {'city': 'Brooklyn'}
+        cache['10 downing street'] = [51.5, -0.12]
+
+        spatial_cache = SpatialCache(cache, 20)
+        assert len(spatial_cache.index) == 1
+
+        cached = spatial_cache.get_many([(40.64750, -73.97238), (40.7, -73.9)])
+        assert cached == {(40.64750, -73.97238): {'city': 'Brooklyn'}}
+        assert spatial_cache.hit_counts['nearby'] == 1
+        assert spatial_cache.hit_counts['miss'] == 1
+
+
+def test_reverse_geocoding_with_tolerance(cache_dir):
+    provider = FakeReverseProvider()
+    config = {'lat_column': 'latitude', 'lng_column': 'longitude', 'batch_enabled': False, 'batch_size': 50,
+              'features': [{'name': 'address', 'column': 'geo_address'}]}
+
+    with CacheHandler(cache_dir) as cache:
+        spatial_cache = SpatialCache(cache, 10)
+        first_df = pd.DataFrame({'latitude': [40.64749], 'longitude': [-73.97237]})
+        add_reverse_geocode_columns(spatial_cache, config, first_df, provider)
+
+        jittered_df = pd.DataFrame({'latitude': [40.647491, 40.647489, 40.9], 'longitude': [-73.972371, -73.97237, -73.9]})
+        jittered_df = add_reverse_geocode_columns(spatial_cache, config, jittered_df, provider)
+
+    assert provider.calls == 2
+    assert jittered_df['geo_address'].tolist()[:2] == ['40.64749 -73.97237'] * 2
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+from cache_handler import CacheHandler
+from dataframe_forward_geocoding import add_forward_geocode_columns
+from dataframe_reverse_geocoding import add_reverse_geocode_columns
+from fake_providers import FakeForwardProvider, FakeReverseProvider
+from virtual_batch import VirtualBatch
+
+
+class FailingProvider(FakeForwardProvider):
+    """
+    Fails on addresses starting with 'error', finds no match for the ones starting with 'nowhere'
+    """
+
+    def answer(self, address):
+        if address.startswith('error'):
+            raise IOError(address)
+        return super(FailingProvider, self).answer(address)
+
+
+def test_virtual_batch():
+    provider = FailingProvider(delay=0.05)
+    results = VirtualBatch(provider, workers=4)(['1 main st', 'error', 'nowhere', '2 main st'])
+
+    assert [res.latlng for res in results] == [[1., -1.], None, None, [2., -2.]]
+    assert results[1].error and not getattr(results[2], 'error', None)
+    assert provider.max_in_flight == 4
+
+
+def test_forward_batch_path():
+    config = {'address_column': 'address', 'latitude': 'latitude', 'longitude': 'longitude', 'batch_enabled': True,
+              'batch_size': 3, 'no_match_ttl': 3600}
+    provider = FailingProvider(delay=0.01)
+    df = pd.DataFrame({'address': ['1 main st', 'error', 'nowhere', '2 main st', '1 main st', '3 main st']})
+
+    with CacheHandler(None, enabled=False) as cache:
+        df = add_forward_geocode_columns(cache, config, df, VirtualBatch(provider, workers=3))
+
+    assert df['latitude'].fillna(-1).tolist() == [1., -1, -1, 2., 1., 3.]
+    assert provider.calls == 5 and provider.max_in_flight <= 3
+
+
+def test_reverse_batch_path():
+    config = {'lat_column': 'lat', 'lng_column': 'lng', 'batch_enabled': True, 'batch_size': 10,
+              'features': [{'name': f, 'column': f} for f in ['address', 'city', 'postal', 'state', 'country']]}
+    provider = FakeReverseProvider()
+    df = pd.DataFrame({'lat': [1.5, 2.5, 1.5], 'lng': [-1., -2., -1.]})
+
+    with CacheHandler(None, enabled=False) as cache:
+        df = add_reverse_geocode_columns(cache, config, df, VirtualBatch(provider, workers=2, unpack=True))
+
+    assert df['city'].tolist() == ['city 1', 'city 2', 'city 1']
+    assert sorted(provider.queries) == [(1.5, -1.), (2.5, -2.)]